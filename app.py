@@ -1,81 +1,186 @@
-from flask import Flask, request, jsonify
-from fill_pdf import generar_pdfs_en_memoria
-from extract_data_hubspot import (
-    GestorDatosHubspot, 
-    extraer_url_archivo,
-    obtener_imagen_desde_url,
-    generar_url_previsualizacion_factura, 
-    cortar_texto_sin_romper_palabras,
-    obtener_urls_videos_desde_ids,
-    filtrar_videos_validos
+import time
+INICIO_ARRANQUE = time.perf_counter()  # antes de importar PyMuPDF y el SDK, para medir el arranque completo
+
+from flask import Flask, Response, request, jsonify, send_file
+from io import BytesIO
+from pdf_service import (
+    ErrorGeneracionPdf,
+    generar_documento_negocio,
+    generar_documentos_lote,
+    generar_pdf_editable_negocio,
+    precargar_datos_negocios,
+    nombre_archivo_pdf
     )
+from extract_data_hubspot import descartar_negocio_precargado
+from template_registry import plantillas_registradas
+from job_queue import ColaTrabajos, ProcesadorCola, COLA_WORKERS
+from metrics import exponer_metricas
+from ttl_cache import estadisticas_caches
+from warmup import iniciar_precarga, esta_listo, estado_precarga
+import threading
+import logging
 import os
 
 app = Flask(__name__)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+
+# Cola durable para el modo asíncrono y sus workers; se crean en crear_app
+cola_trabajos = None
+procesador_cola = None
+_candado_arranque = threading.Lock()
+
+
+def crear_app():
+    """
+    Arranca el servidor: cola de trabajos, precarga (ver /ready) y, al terminar
+    esta, los workers de la cola. Es el punto de entrada (`python app.py` o
+    `gunicorn "app:crear_app()"`) y puede llamarse varias veces.
+
+    No se hace al importar el módulo: los pools de render usan spawn y cada
+    proceso hijo vuelve a importar app.py, que arrancaría su propia cola.
+    """
+    global cola_trabajos, procesador_cola
+    with _candado_arranque:
+        if cola_trabajos is None:
+            cola_trabajos = ColaTrabajos()
+            procesador_cola = ProcesadorCola(
+                cola_trabajos,
+                lambda hubspot_id, plantilla: generar_documento_negocio(
+                    hubspot_id, en_pool_procesos=True, nombre_plantilla=plantilla, usar_precarga=True
+                ).url_pdf,
+                precargar=precargar_datos_negocios
+            )
+            # Los workers de la cola arrancan cuando termina la precarga
+            iniciar_precarga(al_terminar=procesador_cola.iniciar if COLA_WORKERS > 0 else None, inicio_arranque=INICIO_ARRANQUE)
+    return app
+
+# Máximo de negocios aceptados en una petición de lote
+MAX_IDS_LOTE = int(os.getenv("PDF_MAX_IDS_LOTE", "500"))
 
 
 @app.route('/generate_pdf', methods=['POST'])
 def generate_pdf():
     try:
-        # 1. Validación de entrada
+        # Validación de entrada
         data = request.get_json()
         hubspot_id = data.get("id")
         if not hubspot_id:
             return jsonify({"error": "Falta el parámetro 'id' en el JSON"}), 400
+        # La plantilla puede venir en el JSON o en la query string
+        plantilla = data.get("plantilla") or request.args.get("plantilla")
+        if plantilla and plantilla not in plantillas_registradas():
+            return jsonify({"error": f"Plantilla desconocida: {plantilla}"}), 400
+
+        # Modo asíncrono: se encola y se responde al momento con el ID del trabajo
+        if data.get("async") or request.args.get("modo") == "async":
+            job_id, nuevo = cola_trabajos.encolar(hubspot_id, plantilla)
+            # El webhook indica que el negocio cambió: no reutilizar una lectura anterior
+            descartar_negocio_precargado(hubspot_id)
+            return jsonify({
+                "message": "Trabajo encolado" if nuevo else "Ya había un trabajo pendiente para este negocio",
+                "job_id": job_id,
+                "url_estado": f"/jobs/{job_id}"
+            }), 202
+
+        # Datos -> PDF -> subida -> nota (se omite si el documento no cambió)
+        resultado = generar_documento_negocio(hubspot_id, forzar=bool(data.get("forzar")), nombre_plantilla=plantilla)
+
+        # Devolver respuesta final
+        return jsonify({
+            "message": "PDF sin cambios, se reutiliza el anterior" if resultado.sin_cambios else "PDF generado correctamente",
+            "file_id": resultado.file_id,
+            "url_pdf_subido": resultado.url_pdf,
+            "sin_cambios": resultado.sin_cambios
+        })
+
+    except ErrorGeneracionPdf as e:
+        return jsonify({"error": str(e)}), e.codigo_http
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/generate_pdf/batch', methods=['POST'])
+def generate_pdf_batch():
+    try:
+        # Validación de entrada
+        data = request.get_json()
+        ids_negocios = data.get("ids")
+        if not isinstance(ids_negocios, list) or not ids_negocios:
+            return jsonify({"error": "Falta la lista 'ids' en el JSON"}), 400
+        if len(ids_negocios) > MAX_IDS_LOTE:
+            return jsonify({"error": f"Máximo {MAX_IDS_LOTE} negocios por petición"}), 400
+        plantilla = data.get("plantilla") or request.args.get("plantilla")
+        if plantilla and plantilla not in plantillas_registradas():
+            return jsonify({"error": f"Plantilla desconocida: {plantilla}"}), 400
 
-        # 2. Obtener datos desde HubSpot
-        hubspot = GestorDatosHubspot()
-        data_hubspot = hubspot.obtener_datos_negocio(hubspot_id)
-        if not data_hubspot:
-            return jsonify({"error": "No se pudo obtener datos desde HubSpot"}), 404
-
-        # 3. Obtener y preparar URLs de video
-        raw_video_urls = obtener_urls_videos_desde_ids(data_hubspot.get("url_video_trayectoria", ""))
-        video_lista = filtrar_videos_validos(raw_video_urls)
-
-        # 4. Construir diccionario de campos PDF
-        def safe_get(value):
-            return "" if value is None else value
-
-        pdf_data = {
-            'campo_nombre': safe_get((data_hubspot.get('nombre_negocio') or '').split('-')[0]),
-            'campo_telefono': safe_get(data_hubspot.get('telefono_contacto')),
-            'campo_direccion': safe_get(cortar_texto_sin_romper_palabras(data_hubspot.get("direccion_empresa", ""), 110)),
-            'campo_actividad_comercial': safe_get(data_hubspot.get("actividad_comercial")),
-            'campo_tipo_instalacion': safe_get(data_hubspot.get("tipo_instalacion_factura")),
-            'campo_numero_presupuesto': safe_get(data_hubspot.get("tipo_instalacion_negocio")),
-            'descripcion_empresa': safe_get(data_hubspot.get("descripcion_empresa")),
-            'campo_url_video_1': safe_get(video_lista[0]),
-            'campo_url_video_2': safe_get(video_lista[1]),
-            'campo_url_video_3': safe_get(video_lista[2]),
-            'archivo_factura_id': safe_get(extraer_url_archivo(data_hubspot.get("archivo_factura_id"))),
-        }
-
-        # 5. Generar PDFs en memoria
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        template_path = os.path.join(base_dir, "plantilla_pdf", "Archivoeditable.pdf")
-        pdf_editable_io, pdf_flattened_io = generar_pdfs_en_memoria(template_path, pdf_data)
-
-        # 6. Subir PDF a HubSpot
-        file_id, file_url = hubspot.subir_pdf_desde_memoria(pdf_flattened_io, filename=f"Empresa123-{hubspot_id}.pdf")
-        if not file_id:
-            return jsonify({"error": "No se pudo subir el PDF a HubSpot"}), 500
-
-        # 7. Crear nota asociada
-        note_text = "Generado nuevo documento"
-        note_id = hubspot.crear_nota_en_negocio(hubspot_id, note_text, file_id)
-        if not note_id:
-            return jsonify({"error": "No se pudo crear la nota"}), 500
-
-        # 8. Devolver respuesta final
+        resultados = generar_documentos_lote(ids_negocios, plantilla)
         return jsonify({
-            "message": "PDF generado correctamente",
-            "url_pdf_subido": file_url
+            "message": f"{sum(r['ok'] for r in resultados)} de {len(resultados)} PDFs generados",
+            "resultados": resultados
         })
 
+    except ErrorGeneracionPdf as e:
+        return jsonify({"error": str(e)}), e.codigo_http
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/generate_pdf/editable', methods=['GET'])
+def generate_pdf_editable():
+    try:
+        # Validación de entrada
+        hubspot_id = request.args.get("id")
+        if not hubspot_id:
+            return jsonify({"error": "Falta el parámetro 'id' en la URL"}), 400
+
+        # Solo se genera la variante editable y se descarga directamente
+        plantilla = request.args.get("plantilla")
+        pdf_editable = generar_pdf_editable_negocio(hubspot_id, plantilla)
+        return send_file(
+            BytesIO(pdf_editable),
+            mimetype="application/pdf",
+            as_attachment=True,
+            download_name=nombre_archivo_pdf(hubspot_id, plantilla).replace(".pdf", "-editable.pdf")
+        )
+
+    except ErrorGeneracionPdf as e:
+        return jsonify({"error": str(e)}), e.codigo_http
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    trabajo = cola_trabajos.obtener(job_id)
+    if not trabajo:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify({
+        "job_id": trabajo["id"],
+        "id": trabajo["hubspot_id"],
+        "plantilla": trabajo["plantilla"] or None,
+        "estado": trabajo["estado"],
+        "intentos": trabajo["intentos"],
+        "url_pdf_subido": trabajo["url_pdf"],
+        "error": trabajo["error"]
+    })
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    # 503 hasta que termina la precarga, para que el balanceador no envíe tráfico a una instancia fría
+    return jsonify(estado_precarga()), 200 if esta_listo() else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Contadores de las cachés de HubSpot junto a las métricas de etapas
+    caches = estadisticas_caches()
+    extra = {
+        "cache_aciertos_total": ("counter", "Aciertos por caché", [({"cache": n}, e["aciertos"]) for n, e in caches.items()]),
+        "cache_fallos_total": ("counter", "Fallos por caché", [({"cache": n}, e["fallos"]) for n, e in caches.items()]),
+    }
+    return Response(exponer_metricas(extra), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8080)
+    crear_app().run(host="0.0.0.0", port=8080)
@@ -0,0 +1,216 @@
+"""
+Servidor local que imita los endpoints de HubSpot usados por el servicio,
+con latencia y errores configurables, para medir sin tocar api.hubapi.com.
+
+Uso directo:
+    python -m bench.fake_hubspot --puerto 8090 --latencia-ms 80 --tasa-error 0.02
+y arrancar el servicio con HUBSPOT_URL_BASE=http://127.0.0.1:8090
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from itertools import count
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from bench.synthetic import crear_imagen_jpeg
+
+RUTA_NEGOCIO = re.compile(r"^/crm/v3/objects/deals/(\w+)$")
+RUTA_ARCHIVO = re.compile(r"^/files/v3/files/(\w+)$")
+RUTA_IMAGEN = re.compile(r"^/imagenes/(\d+)x(\d+)(?:-\w+)?\.jpg$")
+
+
+def propiedades_negocio(id_negocio, pedidas=None):
+    """
+    Propiedades sintéticas de un negocio: 3 videos y una factura por negocio.
+    Como HubSpot, si se indican `pedidas` solo se devuelven esas.
+    """
+    propiedades = {
+        "nombre_negocio": f"Empresa {id_negocio}-Propuesta",
+        "telefono_contacto": "+34 600 000 000",
+        "direccion_empresa": "Calle de la Industria 42, Polígono Sur, 28000 Madrid, España " * 2,
+        "actividad_comercial": "Fabricación de componentes",
+        "tipo_instalacion_factura": "Autoconsumo",
+        "tipo_instalacion_pdr": "Cubierta",
+        "tipo_instalacion_negocio": f"P-{id_negocio}",
+        "descripcion_empresa": "Empresa dedicada a la fabricación de componentes metálicos. " * 3,
+        "url_video_trayectoria": f"{id_negocio}1;{id_negocio}2;{id_negocio}3",
+        "archivo_factura_id": f"{id_negocio}9",
+    }
+    if pedidas:
+        return {clave: valor for clave, valor in propiedades.items() if clave in pedidas}
+    return propiedades
+
+
+class ServidorHubspotFalso:
+    """
+    Servidor HTTP en un hilo que responde como HubSpot.
+
+    Parámetros:
+    - latencia_ms (float): latencia media añadida a cada respuesta
+    - variacion_ms (float): variación uniforme +/- sobre la latencia
+    - tasa_error (float): fracción de respuestas 503
+    - tasa_429 (float): fracción de respuestas 429 con Retry-After
+    """
+
+    def __init__(self, puerto=0, latencia_ms=0, variacion_ms=0, tasa_error=0.0, tasa_429=0.0, semilla=None):
+        self.latencia_ms = latencia_ms
+        self.variacion_ms = variacion_ms
+        self.tasa_error = tasa_error
+        self.tasa_429 = tasa_429
+        self.aleatorio = random.Random(semilla)
+        self.peticiones = 0
+        self._ids = count(1000)
+        self._imagenes = {}
+        self._candado = threading.Lock()
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", puerto), self._crear_manejador())
+        self._servidor.daemon_threads = True
+        self._hilo = None
+
+    @property
+    def url(self):
+        host, puerto = self._servidor.server_address
+        return f"http://{host}:{puerto}"
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def imagen(self, ancho, alto):
+        with self._candado:
+            if (ancho, alto) not in self._imagenes:
+                self._imagenes[(ancho, alto)] = crear_imagen_jpeg(ancho, alto)
+            return self._imagenes[(ancho, alto)]
+
+    def _nuevo_id(self):
+        with self._candado:
+            return str(next(self._ids))
+
+    def _crear_manejador(self):
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, codigo, cuerpo, headers=None):
+                datos = json.dumps(cuerpo).encode("utf-8")
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(datos)))
+                for clave, valor in (headers or {}).items():
+                    self.send_header(clave, valor)
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def _leer_cuerpo(self):
+                longitud = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(longitud) if longitud else b""
+
+            def _simular_red(self):
+                with servidor._candado:
+                    servidor.peticiones += 1
+                    espera = servidor.latencia_ms + servidor.aleatorio.uniform(-servidor.variacion_ms, servidor.variacion_ms)
+                    sorteo = servidor.aleatorio.random()
+                if espera > 0:
+                    time.sleep(espera / 1000)
+                if sorteo < servidor.tasa_429:
+                    self._json(429, {"status": "error", "category": "RATE_LIMITS"}, {"Retry-After": "1"})
+                    return False
+                if sorteo < servidor.tasa_429 + servidor.tasa_error:
+                    self._json(503, {"status": "error", "message": "Servicio no disponible"})
+                    return False
+                return True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                ruta = url.path
+                if not self._simular_red():
+                    return
+                ahora = datetime.now(timezone.utc).isoformat()
+
+                if coincidencia := RUTA_NEGOCIO.match(ruta):
+                    id_negocio = coincidencia.group(1)
+                    pedidas = {p for valor in parse_qs(url.query).get("properties", []) for p in valor.split(",")}
+                    return self._json(200, {
+                        "id": id_negocio, "properties": propiedades_negocio(id_negocio, pedidas),
+                        "createdAt": ahora, "updatedAt": ahora, "archived": False,
+                    })
+                if coincidencia := RUTA_ARCHIVO.match(ruta):
+                    id_archivo = coincidencia.group(1)
+                    extension = "pdf" if id_archivo.endswith("9") else "mp4"
+                    return self._json(200, {"id": id_archivo, "url": f"{servidor.url}/archivos/{id_archivo}.{extension}"})
+                if ruta == "/crm/v4/associations/notes/deals/labels":
+                    return self._json(200, {"results": [{"category": "HUBSPOT_DEFINED", "typeId": 214, "label": None}]})
+                if coincidencia := RUTA_IMAGEN.match(ruta):
+                    etag = f'"{coincidencia.group(1)}x{coincidencia.group(2)}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    datos = servidor.imagen(int(coincidencia.group(1)), int(coincidencia.group(2)))
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/jpeg")
+                    self.send_header("Content-Length", str(len(datos)))
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    self.wfile.write(datos)
+                    return
+                self._json(404, {"status": "error", "message": f"Ruta no simulada: {ruta}"})
+
+            def do_POST(self):
+                ruta = urlparse(self.path).path
+                cuerpo = self._leer_cuerpo()
+                if not self._simular_red():
+                    return
+                ahora = datetime.now(timezone.utc).isoformat()
+
+                if ruta == "/crm/v3/objects/deals/batch/read":
+                    lectura = json.loads(cuerpo or b"{}")
+                    pedidas = set(lectura.get("properties") or [])
+                    resultados = [
+                        {"id": e["id"], "properties": propiedades_negocio(e["id"], pedidas),
+                         "createdAt": ahora, "updatedAt": ahora, "archived": False}
+                        for e in lectura.get("inputs", [])
+                    ]
+                    return self._json(200, {"status": "COMPLETE", "results": resultados, "startedAt": ahora, "completedAt": ahora})
+                if ruta == "/files/v3/files":
+                    id_archivo = servidor._nuevo_id()
+                    return self._json(201, {"id": id_archivo, "url": f"{servidor.url}/archivos/{id_archivo}.pdf", "size": len(cuerpo)})
+                if ruta == "/crm/v3/objects/notes":
+                    return self._json(201, {"id": servidor._nuevo_id(), "properties": {}, "createdAt": ahora, "updatedAt": ahora})
+                if ruta == "/crm/v4/associations/notes/deals/batch/create":
+                    return self._json(201, {"status": "COMPLETE", "results": [], "startedAt": ahora, "completedAt": ahora})
+                self._json(404, {"status": "error", "message": f"Ruta no simulada: {ruta}"})
+
+        return Manejador
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor HubSpot simulado para benchmarks")
+    parser.add_argument("--puerto", type=int, default=8090)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--variacion-ms", type=float, default=0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    args = parser.parse_args()
+
+    servidor = ServidorHubspotFalso(args.puerto, args.latencia_ms, args.variacion_ms, args.tasa_error, args.tasa_429).iniciar()
+    print(f"🧪 HubSpot simulado escuchando en {servidor.url} (Ctrl+C para salir)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.detener()
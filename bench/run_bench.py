@@ -0,0 +1,213 @@
+"""
+Escenarios de benchmark reproducibles contra el HubSpot simulado.
+
+    python -m bench.run_bench render --iteraciones 30 --paginas 2 --fotos-por-pagina 4 --tamano-imagen 4000x3000
+    python -m bench.run_bench e2e --iteraciones 100 --concurrencia 4 --latencia-ms 80 --tasa-error 0.01
+
+Informa latencia p50/p99, peticiones por segundo y pico de memoria (RSS).
+Ejecutar antes y después de cada cambio de rendimiento con los mismos argumentos.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fake_hubspot import ServidorHubspotFalso
+from bench.synthetic import crear_plantilla
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def _pico_rss_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def _medir(funcion, iteraciones, concurrencia, calentamiento):
+    for indice in range(calentamiento):
+        try:
+            funcion(-1 - indice)
+        except Exception as e:
+            print(f"⚠️ Error en calentamiento: {e}")
+
+    def cronometrar(indice):
+        inicio = time.perf_counter()
+        error = None
+        try:
+            funcion(indice)
+        except Exception as e:
+            error = str(e)
+        return time.perf_counter() - inicio, error
+
+    rss_inicial = _pico_rss_mb()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        resultados = list(pool.map(cronometrar, range(iteraciones)))
+    total = time.perf_counter() - inicio
+
+    latencias = [duracion for duracion, _ in resultados]
+    errores = [error for _, error in resultados if error]
+    return {
+        "iteraciones": iteraciones,
+        "concurrencia": concurrencia,
+        "errores": len(errores),
+        "p50_ms": round(_percentil(latencias, 50) * 1000, 1),
+        "p99_ms": round(_percentil(latencias, 99) * 1000, 1),
+        "media_ms": round(sum(latencias) / len(latencias) * 1000, 1),
+        "peticiones_por_segundo": round(iteraciones / total, 2),
+        "pico_rss_mb": round(_pico_rss_mb(), 1),
+        "pico_rss_inicial_mb": round(rss_inicial, 1),
+        "primer_error": errores[0] if errores else None,
+    }
+
+
+def escenario_render(args, servidor, ruta_plantilla):
+    """
+    Solo generar_pdfs_en_memoria: plantilla sintética con fotos servidas por el servidor simulado.
+    """
+    from fill_pdf import generar_pdfs_en_memoria, VARIANTES_TODAS
+    from render_incremental import renderizar_aplanado_incremental
+    from render_paralelo import renderizar_aplanado_en_paralelo
+    from pdf_optimizer import optimizar_pdf
+
+    campos_foto = crear_plantilla(ruta_plantilla, args.paginas, args.fotos_por_pagina)
+    ancho, alto = args.tamano_imagen
+    datos = {
+        "campo_nombre": "Empresa de prueba",
+        "campo_telefono": "+34 600 000 000",
+        "campo_direccion": "Calle de la Industria 42, 28000 Madrid",
+        "descripcion_empresa": "Empresa dedicada a la fabricación de componentes metálicos. " * 3,
+        "campo_url_video_1": f"{servidor.url}/archivos/1.mp4",
+    }
+    for indice, campo in enumerate(campos_foto):
+        sufijo = "" if args.repetir_imagen else f"-{indice}"
+        datos[campo] = f"{servidor.url}/imagenes/{ancho}x{alto}{sufijo}.jpg"
+
+    tamanos = []
+
+    def renderizar(indice):
+        if args.incremental:
+            # Mismo negocio cambiando un solo campo de texto en cada iteración
+            tamanos.append(len(renderizar_aplanado_incremental(ruta_plantilla, "bench", dict(datos, campo_telefono=f"+34 600 {indice:06d}"))))
+            return
+        if args.render_paralelo:
+            pdf_aplanado = renderizar_aplanado_en_paralelo(ruta_plantilla, datos)
+            tamanos.append(len(optimizar_pdf(pdf_aplanado) if args.optimizar else pdf_aplanado))
+            return
+        variantes = VARIANTES_TODAS if args.variante == "ambas" else (args.variante,)
+        pdf_editable, pdf_aplanado = generar_pdfs_en_memoria(ruta_plantilla, datos, variantes=variantes)
+        if args.optimizar:
+            pdf_aplanado = pdf_aplanado and optimizar_pdf(pdf_aplanado)
+            pdf_editable = pdf_editable and optimizar_pdf(pdf_editable, subconjunto_fuentes=False)
+        tamanos.append(len(pdf_aplanado or pdf_editable))
+
+    resultado = _medir(renderizar, args.iteraciones, args.concurrencia, args.calentamiento)
+    resultado["tamano_pdf_kb"] = round(tamanos[-1] / 1024, 1) if tamanos else None
+    return resultado
+
+
+def escenario_e2e(args, servidor, ruta_plantilla):
+    """
+    POST /generate_pdf completo (datos, archivos, render, subida y nota) contra el servidor simulado.
+    """
+    crear_plantilla(ruta_plantilla, args.paginas, 0)
+    from app import crear_app
+    from warmup import esperar_precarga
+
+    cliente = crear_app().test_client()
+    # Medir con el servidor ya precargado, como tras pasar /ready
+    esperar_precarga()
+
+    def generar(indice):
+        respuesta = cliente.post("/generate_pdf", json={"id": str(abs(indice) % args.negocios_distintos + 1)})
+        if respuesta.status_code != 200:
+            raise RuntimeError(f"{respuesta.status_code}: {respuesta.get_json()}")
+
+    return _medir(generar, args.iteraciones, args.concurrencia, args.calentamiento)
+
+
+ESCENARIOS = {"render": escenario_render, "e2e": escenario_e2e}
+
+
+def _tamano(valor):
+    ancho, alto = valor.lower().split("x")
+    return int(ancho), int(alto)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del generador de PDFs")
+    parser.add_argument("escenario", choices=sorted(ESCENARIOS))
+    parser.add_argument("--iteraciones", type=int, default=30)
+    parser.add_argument("--calentamiento", type=int, default=2)
+    parser.add_argument("--concurrencia", type=int, default=1)
+    parser.add_argument("--paginas", type=int, default=1)
+    parser.add_argument("--fotos-por-pagina", type=int, default=4)
+    parser.add_argument("--tamano-imagen", type=_tamano, default=(3000, 2000), help="ANCHOxALTO en píxeles")
+    parser.add_argument("--variante", choices=["aplanado", "editable", "ambas"], default="aplanado")
+    parser.add_argument("--incremental", action="store_true", help="render: cambiar un campo de texto por iteración sobre el render anterior")
+    parser.add_argument("--render-paralelo", action="store_true", help="render: repartir las páginas del documento entre procesos")
+    parser.add_argument("--optimizar", action="store_true", help="render: aplicar la etapa final de optimización (pdf_optimizer)")
+    parser.add_argument("--repetir-imagen", action="store_true", help="usar la misma URL en todos los campos de foto")
+    parser.add_argument("--negocios-distintos", type=int, default=50)
+    parser.add_argument("--omitir-sin-cambios", action="store_true", help="reutilizar documentos ya subidos si no cambiaron")
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--variacion-ms", type=float, default=0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", help="guardar el resultado en este archivo")
+    args = parser.parse_args(argv)
+
+    servidor = ServidorHubspotFalso(
+        latencia_ms=args.latencia_ms,
+        variacion_ms=args.variacion_ms,
+        tasa_error=args.tasa_error,
+        tasa_429=args.tasa_429,
+        semilla=args.semilla,
+    ).iniciar()
+    directorio = tempfile.mkdtemp(prefix="bench_pdf_")
+    ruta_plantilla = os.path.join(directorio, "plantilla.pdf")
+
+    # La configuración del servicio se lee al importar sus módulos
+    os.environ.update({
+        "API_KEY": "bench",
+        "HUBSPOT_URL_BASE": servidor.url,
+        "IMAGENES_CACHE_DIR": os.path.join(directorio, "imagenes"),
+        "PDF_RUTA_PLANTILLA": ruta_plantilla,
+        "COLA_WORKERS": "0",
+        "COLA_SQLITE_RUTA": os.path.join(directorio, "cola.sqlite3"),
+        "HUELLAS_SQLITE_RUTA": os.path.join(directorio, "huellas.sqlite3"),
+        "PDF_OMITIR_SIN_CAMBIOS": "1" if args.omitir_sin_cambios else "0",
+        "PDF_RENDER_PARALELO": "1" if args.render_paralelo else "0",
+        "CACHE_BACKEND": "memoria",
+        "PRECARGA_POOLS": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+
+    try:
+        resultado = ESCENARIOS[args.escenario](args, servidor, ruta_plantilla)
+    finally:
+        servidor.detener()
+    resultado = {"escenario": args.escenario, "parametros": vars(args), "peticiones_servidor": servidor.peticiones, **resultado}
+
+    print(f"\n📊 Escenario {args.escenario}")
+    for clave, valor in resultado.items():
+        if clave != "parametros":
+            print(f"  {clave}: {valor}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    return resultado
+
+
+if __name__ == "__main__":
+    main()
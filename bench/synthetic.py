@@ -0,0 +1,70 @@
+"""
+Plantillas PDF e imágenes sintéticas para los benchmarks.
+"""
+import random
+
+import fitz  # PyMuPDF
+
+# Campos de la plantilla "propuesta" (ver template_registry)
+CAMPOS_TEXTO = [
+    "campo_nombre",
+    "campo_telefono",
+    "campo_direccion",
+    "campo_actividad_comercial",
+    "campo_tipo_instalacion",
+    "campo_numero_presupuesto",
+    "descripcion_empresa",
+    "campo_url_video_1",
+    "campo_url_video_2",
+    "campo_url_video_3",
+    "archivo_factura_id",
+]
+
+
+def crear_imagen_jpeg(ancho, alto, calidad=90, semilla=0):
+    """
+    Genera una imagen JPEG con ruido (comprime mal, como una foto real).
+    """
+    muestras = random.Random(semilla).randbytes(ancho * alto * 3)
+    pix = fitz.Pixmap(fitz.csRGB, ancho, alto, muestras, False)
+    return pix.tobytes("jpeg", jpg_quality=calidad)
+
+
+def crear_plantilla(ruta, paginas=1, fotos_por_pagina=0):
+    """
+    Crea una plantilla PDF con los campos de texto del servicio repartidos
+    entre las páginas y `fotos_por_pagina` campos de imagen (campo_foto_P_N) por página.
+    Con una sola página caben 4 fotos; con más páginas, hasta 8 por página.
+
+    Retorna:
+    - list[str]: nombres de los campos de foto creados
+    """
+    documento = fitz.open()
+    campos_foto = []
+    for numero_pagina in range(paginas):
+        pagina = documento.new_page(width=595, height=842)
+        pagina.insert_text((40, 30), f"Propuesta sintética - página {numero_pagina + 1}", fontsize=12)
+        campos = [c for i, c in enumerate(CAMPOS_TEXTO) if i % paginas == numero_pagina]
+        y = 50
+        for campo in campos:
+            _agregar_campo(pagina, campo, fitz.Rect(40, y, 555, y + 36))
+            y += 42
+        for indice in range(fotos_por_pagina):
+            campo = f"campo_foto_{numero_pagina}_{indice}"
+            fila, columna = divmod(indice, 2)
+            x0 = 40 + columna * 262
+            y0 = y + fila * 130
+            _agregar_campo(pagina, campo, fitz.Rect(x0, y0, x0 + 250, y0 + 120))
+            campos_foto.append(campo)
+    documento.save(ruta)
+    documento.close()
+    return campos_foto
+
+
+def _agregar_campo(pagina, nombre, rect):
+    widget = fitz.Widget()
+    widget.field_name = nombre
+    widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+    widget.rect = rect
+    widget.text_fontsize = 8
+    pagina.add_widget(widget)
@@ -0,0 +1,322 @@
+"""
+Generación masiva de PDFs desde un export de negocios, sin leer de HubSpot.
+
+    python bulk_render.py negocios.csv --salida pdfs/
+    python bulk_render.py negocios.jsonl --salida pdfs.zip --plantilla propuesta --procesos 8
+    python bulk_render.py negocios.csv --salida pdfs/ --subir
+
+El export (CSV con cabecera o JSONL con un objeto por línea) usa los mismos
+nombres de propiedades que GestorDatosHubspot.obtener_datos_negocio, más el ID
+del negocio en `id` o `hs_object_id`. Las filas se leen y renderizan en
+streaming, así que el tamaño del export no limita la memoria.
+
+Sin `--resolver-archivos` no se consulta ninguna API: los videos y la factura
+solo se enlazan si el export ya trae sus URLs. Con `--subir` el PDF aplanado se
+sube y se crea la nota como en /generate_pdf, omitiendo los documentos que no
+cambiaron desde la última subida.
+"""
+import os
+import csv
+import json
+import time
+import argparse
+import zipfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from fill_pdf import generar_pdfs_en_memoria, VARIANTE_EDITABLE, VARIANTE_APLANADA, VARIANTES_TODAS
+from template_registry import obtener_plan, compilar_plantillas, PROPIEDAD_VIDEOS, PROPIEDAD_FACTURA
+from extract_data_hubspot import GestorDatosHubspot, filtrar_videos_validos
+from pdf_service import (
+    PROCESOS_RENDER,
+    MAX_SUBIDAS_PARALELAS,
+    construir_datos_pdf,
+    nombre_archivo_pdf,
+    clave_documento,
+    buscar_documento_sin_cambios,
+    publicar_pdf,
+    registrar_documento_subido,
+)
+from idempotency import calcular_huella
+from pdf_optimizer import optimizar_pdf
+
+COLUMNAS_ID = ("id", "hs_object_id")
+# Motivo con el que omitir_sin_cambios salta un documento (no cuenta como error)
+SIN_CAMBIOS = "Sin cambios desde la última subida"
+VARIANTES_CLI = {
+    "aplanado": (VARIANTE_APLANADA,),
+    "editable": (VARIANTE_EDITABLE,),
+    "ambas": VARIANTES_TODAS,
+}
+
+
+def leer_negocios(ruta):
+    """
+    Recorre las filas del export (CSV o JSONL según la extensión) sin cargarlo entero.
+
+    Retorna:
+    - generador de dict: propiedades de cada negocio
+    """
+    with open(ruta, newline="", encoding="utf-8") as f:
+        if ruta.lower().endswith((".jsonl", ".ndjson")):
+            for linea in f:
+                if linea.strip():
+                    yield json.loads(linea)
+        else:
+            yield from csv.DictReader(f)
+
+
+def id_negocio(fila):
+    return next((str(fila[columna]).strip() for columna in COLUMNAS_ID if fila.get(columna)), None)
+
+
+def resolver_archivos_sin_api(propiedades):
+    """
+    Equivalente offline de resolver_videos_y_factura: usa solo las URLs que ya
+    trae el export (los IDs de archivo sin URL se quedan sin enlace).
+    """
+    videos = propiedades.get(PROPIEDAD_VIDEOS)
+    if isinstance(videos, str):
+        videos = [valor.strip() for valor in videos.split(";")]
+    propiedades[PROPIEDAD_VIDEOS] = filtrar_videos_validos(videos)
+
+    factura = propiedades.get(PROPIEDAD_FACTURA)
+    try:
+        # Mismo formato JSON que devuelve HubSpot para propiedades de archivo
+        lista = json.loads(factura)
+        factura = lista[0]["url"] if isinstance(lista, list) and lista else factura
+    except (json.JSONDecodeError, KeyError, TypeError):
+        pass
+    propiedades[PROPIEDAD_FACTURA] = factura if isinstance(factura, str) and factura.startswith("http") else None
+    return propiedades
+
+
+def preparar_documentos(filas, plan, resolver_archivos=False):
+    """
+    Convierte cada fila del export en los campos del PDF de la plantilla.
+
+    Retorna:
+    - generador de tuple (str, dict | None, str | None): ID, campos del PDF y error
+    """
+    for numero_fila, fila in enumerate(filas, start=1):
+        hubspot_id = id_negocio(fila)
+        if not hubspot_id:
+            yield f"fila-{numero_fila}", None, "Fila sin ID de negocio"
+            continue
+        try:
+            # Mismo mapeo de propiedades (derivadas incluidas) que la lectura desde la API
+            propiedades = GestorDatosHubspot.extraer_datos(fila, plan.propiedades)
+            if resolver_archivos:
+                yield hubspot_id, construir_datos_pdf(propiedades, plan), None
+            else:
+                yield hubspot_id, plan.construir_datos(resolver_archivos_sin_api(propiedades)), None
+        except Exception as e:
+            yield hubspot_id, None, str(e)
+
+
+def renderizar_documento(nombre_plantilla, pdf_data, variantes):
+    """
+    Renderiza las variantes pedidas de un documento. Es una función de módulo
+    para poder ejecutarse en el pool de procesos.
+
+    Retorna:
+    - tuple (bytes | None, bytes | None, list): PDF editable, PDF aplanado y
+      campos del aplanado que no se pudieron dibujar
+    """
+    plan = obtener_plan(nombre_plantilla)
+    campos_fallidos = []
+    pdf_editable, pdf_aplanado = generar_pdfs_en_memoria(plan.ruta, pdf_data, variantes=variantes, tipos_campos=plan.tipos_campos,
+                                                         ajustes_campos=plan.ajustes_campos, campos_fallidos=campos_fallidos)
+    return (
+        optimizar_pdf(pdf_editable, subconjunto_fuentes=False) if pdf_editable else None,
+        optimizar_pdf(pdf_aplanado) if pdf_aplanado else None,
+        campos_fallidos,
+    )
+
+
+def renderizar_en_pool(documentos, pool, nombre_plantilla, variantes, max_en_vuelo):
+    """
+    Envía los documentos al pool manteniendo como mucho `max_en_vuelo`
+    pendientes, para no adelantar todo el export a memoria. Los documentos
+    que llegan con error pasan sin renderizar, en su posición del export.
+
+    Retorna:
+    - generador de tuple (str, dict, tuple | None, str | None): ID, campos del PDF,
+      PDFs (editable, aplanado, campos fallidos) y error, en el orden del export
+    """
+    pendientes = deque()
+
+    def siguiente():
+        hubspot_id, pdf_data, futuro, error = pendientes.popleft()
+        if futuro is None:
+            return hubspot_id, pdf_data, None, error
+        try:
+            return hubspot_id, pdf_data, futuro.result(), None
+        except Exception as e:
+            return hubspot_id, pdf_data, None, str(e)
+
+    for hubspot_id, pdf_data, error in documentos:
+        futuro = None if error else pool.submit(renderizar_documento, nombre_plantilla, pdf_data, variantes)
+        pendientes.append((hubspot_id, pdf_data, futuro, error))
+        while len(pendientes) >= max_en_vuelo:
+            yield siguiente()
+    while pendientes:
+        yield siguiente()
+
+
+def omitir_sin_cambios(documentos, plan):
+    """
+    Marca con SIN_CAMBIOS los documentos cuya huella coincide con la última
+    subida del negocio, para no renderizarlos ni subirlos de nuevo.
+    """
+    for hubspot_id, pdf_data, error in documentos:
+        if not error:
+            _, previo = buscar_documento_sin_cambios(clave_documento(hubspot_id, plan), pdf_data, plan)
+            if previo:
+                error = SIN_CAMBIOS
+        yield hubspot_id, pdf_data, error
+
+
+class SalidaPdfs:
+    """
+    Destino de los PDFs generados: un directorio o, si la ruta acaba en .zip, un zip.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.bytes_escritos = 0
+        if ruta.lower().endswith(".zip"):
+            # Los streams del PDF ya van comprimidos: deflate apenas reduce y cuesta CPU
+            self._zip = zipfile.ZipFile(ruta, "w", compression=zipfile.ZIP_STORED)
+        else:
+            self._zip = None
+            os.makedirs(ruta, exist_ok=True)
+
+    def guardar(self, nombre_archivo, contenido):
+        if self._zip is not None:
+            self._zip.writestr(nombre_archivo, contenido)
+        else:
+            with open(os.path.join(self.ruta, nombre_archivo), "wb") as f:
+                f.write(contenido)
+        self.bytes_escritos += len(contenido)
+
+    def cerrar(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+def generar_desde_export(ruta_export, salida, nombre_plantilla=None, variante="aplanado", procesos=PROCESOS_RENDER,
+                         resolver_archivos=False, subir=False):
+    """
+    Lee el export, renderiza sus documentos en un pool de procesos y los
+    guarda en `salida` (y opcionalmente los sube a HubSpot).
+
+    Retorna:
+    - dict: contadores y rendimiento de la ejecución
+    """
+    plan = obtener_plan(nombre_plantilla)
+    variantes = VARIANTES_CLI[variante]
+    if subir and VARIANTE_APLANADA not in variantes:
+        raise ValueError("--subir necesita la variante aplanada")
+
+    estadisticas = {"filas": 0, "generados": 0, "errores": 0, "sin_cambios": 0, "subidos": 0}
+    destino = SalidaPdfs(salida)
+    hubspot = GestorDatosHubspot() if subir else None
+    limite_subidas = threading.BoundedSemaphore(MAX_SUBIDAS_PARALELAS * 2)
+    candado = threading.Lock()
+
+    def contar(contador):
+        # El bucle principal y los hilos de subida comparten los contadores
+        with candado:
+            estadisticas[contador] += 1
+
+    def subir_documento(hubspot_id, pdf_data, pdf_aplanado, campos_fallidos):
+        try:
+            clave = clave_documento(hubspot_id, plan)
+            huella = calcular_huella(pdf_data, plan.version)
+            file_id, file_url = publicar_pdf(hubspot, hubspot_id, pdf_aplanado, nombre_archivo_pdf(hubspot_id, plan.nombre))
+            registrar_documento_subido(clave, huella, file_id, file_url, campos_fallidos)
+            contar("subidos")
+        except Exception as e:
+            print(f"❌ Error al subir el PDF del negocio {hubspot_id}: {e}")
+            contar("errores")
+        finally:
+            limite_subidas.release()
+
+    documentos = preparar_documentos(leer_negocios(ruta_export), plan, resolver_archivos)
+    if subir:
+        documentos = omitir_sin_cambios(documentos, plan)
+
+    inicio = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"))
+    subidas = ThreadPoolExecutor(max_workers=MAX_SUBIDAS_PARALELAS, thread_name_prefix="pdf-subidas") if subir else None
+    try:
+        for hubspot_id, pdf_data, pdfs, error in renderizar_en_pool(documentos, pool, plan.nombre, variantes, procesos * 2):
+            contar("filas")
+            if error == SIN_CAMBIOS:
+                contar("sin_cambios")
+                continue
+            if error:
+                print(f"❌ Negocio {hubspot_id}: {error}")
+                contar("errores")
+                continue
+
+            pdf_editable, pdf_aplanado, campos_fallidos = pdfs
+            nombre_archivo = nombre_archivo_pdf(hubspot_id, plan.nombre)
+            if pdf_aplanado:
+                destino.guardar(nombre_archivo, pdf_aplanado)
+            if pdf_editable:
+                destino.guardar(nombre_archivo.replace(".pdf", "-editable.pdf"), pdf_editable)
+            contar("generados")
+
+            if subir:
+                # Espera si las subidas van por detrás del render
+                limite_subidas.acquire()
+                subidas.submit(subir_documento, hubspot_id, pdf_data, pdf_aplanado, campos_fallidos)
+    finally:
+        if subidas is not None:
+            subidas.shutdown(wait=True)
+        pool.shutdown(wait=True)
+        destino.cerrar()
+
+    segundos = time.perf_counter() - inicio
+    estadisticas.update({
+        "segundos": round(segundos, 2),
+        "documentos_por_segundo": round(estadisticas["generados"] / segundos, 2) if segundos else None,
+        "mb_escritos": round(destino.bytes_escritos / (1024 * 1024), 1),
+    })
+    return estadisticas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera PDFs desde un export de negocios (CSV o JSONL)")
+    parser.add_argument("export", help="archivo .csv o .jsonl con las propiedades de los negocios")
+    parser.add_argument("--salida", required=True, help="directorio de destino o archivo .zip")
+    parser.add_argument("--plantilla", help="plantilla registrada (por defecto PDF_PLANTILLA_POR_DEFECTO)")
+    parser.add_argument("--variante", choices=sorted(VARIANTES_CLI), default="aplanado")
+    parser.add_argument("--procesos", type=int, default=PROCESOS_RENDER)
+    parser.add_argument("--resolver-archivos", action="store_true", help="consultar la API de archivos para los IDs de videos y factura")
+    parser.add_argument("--subir", action="store_true", help="subir cada PDF aplanado a HubSpot y crear la nota")
+    args = parser.parse_args(argv)
+
+    compilar_plantillas()
+    estadisticas = generar_desde_export(
+        args.export,
+        args.salida,
+        nombre_plantilla=args.plantilla,
+        variante=args.variante,
+        procesos=args.procesos,
+        resolver_archivos=args.resolver_archivos,
+        subir=args.subir,
+    )
+
+    print(f"\n📊 Export {args.export} -> {args.salida}")
+    for clave, valor in estadisticas.items():
+        print(f"  {clave}: {valor}")
+    return estadisticas
+
+
+if __name__ == "__main__":
+    main()
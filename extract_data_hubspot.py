@@ -4,6 +4,8 @@ import json
 import time
 import mimetypes
 from io import BytesIO
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 
 # Dependencias externas
@@ -13,7 +15,11 @@ import hubspot
 from hubspot import Client
 
 # Módulos específicos de HubSpot
-from hubspot.crm.deals import ApiException as DealsApiException
+from hubspot.crm.deals import (
+    ApiException as DealsApiException,
+    BatchReadInputSimplePublicObjectId,
+    SimplePublicObjectId,
+)
 from hubspot.crm.objects.notes import (
     SimplePublicObjectInputForCreate,
     BasicApi,
@@ -22,70 +28,190 @@ from hubspot.crm.objects.notes import (
 from hubspot.crm.objects import ApiException as ObjectsApiException
 from hubspot.crm.associations import PublicAssociation
 
+# Transporte compartido (pool de conexiones, timeouts y reintentos)
+from hubspot_http import (
+    TIMEOUT,
+    FACTOR_BACKOFF,
+    CuerpoMultipart,
+    obtener_sesion,
+    peticion_hubspot,
+    obtener_cliente_hubspot,
+    obtener_api_negocios,
+)
+from ttl_cache import crear_cache
+
 load_dotenv() 
 
+# Consultas concurrentes a la API de archivos (videos, factura)
+MAX_CONSULTAS_PARALELAS = int(os.getenv("HUBSPOT_MAX_CONSULTAS_PARALELAS", "8"))
+PLAZO_CONSULTAS_SEG = float(os.getenv("HUBSPOT_PLAZO_CONSULTAS_SEG", "10"))
+_pool_consultas = ThreadPoolExecutor(max_workers=MAX_CONSULTAS_PARALELAS, thread_name_prefix="hubspot-consultas")
+
+# Intentos de la subida de PDFs (sobre el mismo buffer), en total: la subida va por
+# una sesión sin reintentos propios. Solo ante errores de conexión, 429 y 502/503/504;
+# ver la política de reintentos en hubspot_http
+INTENTOS_SUBIDA = int(os.getenv("HUBSPOT_INTENTOS_SUBIDA", "3"))
+CODIGOS_REINTENTO_SUBIDA = (429, 502, 503, 504)
+
+# Cachés de metadatos que casi nunca cambian
+_cache_tipo_asociacion = crear_cache(
+    "tipo_asociacion_nota_negocio",
+    ttl_seg=float(os.getenv("CACHE_TTL_TIPO_ASOCIACION_SEG", "86400")),
+    max_entradas=8,
+)
+# Propiedades de negocios leídas por adelantado (precargar_negocios); se consumen al usarse
+_cache_negocios_precargados = crear_cache(
+    "negocios_precargados",
+    ttl_seg=float(os.getenv("CACHE_TTL_NEGOCIOS_SEG", "15")),
+    max_entradas=int(os.getenv("CACHE_MAX_NEGOCIOS", "1000")),
+)
+_cache_urls_archivos = crear_cache(
+    "urls_archivos",
+    ttl_seg=float(os.getenv("CACHE_TTL_URLS_ARCHIVOS_SEG", "3600")),
+    max_entradas=int(os.getenv("CACHE_MAX_URLS_ARCHIVOS", "10000")),
+)
+
 class GestorDatosHubspot:
+    # Propiedades del negocio que se leen si no se indican otras (las de la plantilla por defecto)
+    CAMPOS_NEGOCIO = [
+        "nombre_negocio",
+        "telefono_contacto",
+        "direccion_empresa",
+        "actividad_comercial",
+        "tipo_instalacion",
+        "tipo_instalacion_negocio",
+        "descripcion_empresa",
+        "url_video_trayectoria",
+        "archivo_factura_id"
+    ]
+    # Propiedades calculadas: primer valor no vacío entre las propiedades de HubSpot indicadas
+    PROPIEDADES_DERIVADAS = {
+        "tipo_instalacion": ("tipo_instalacion_factura", "tipo_instalacion_pdr"),
+    }
+    # Límite de IDs por llamada a la API batch de HubSpot
+    TAMANO_LOTE_LECTURA = 100
+
     def __init__(self):
-        self.datos_negocio = {}
-        self.cliente = hubspot.Client.create(access_token=os.getenv("API_KEY"))
-    
-    def obtener_datos_negocio(self, id_negocio):
+        self.cliente = obtener_cliente_hubspot()
+
+    @classmethod
+    def propiedades_a_pedir(cls, propiedades=None):
         """
-        Extrae propiedades relevantes de un negocio en HubSpot usando su ID.
+        Propiedades reales de HubSpot que hay que pedir para obtener `propiedades`
+        (las derivadas se sustituyen por sus propiedades de origen).
         """
-        campos_a_extraer = [
-            "nombre_negocio",
-            "telefono_contacto",
-            "direccion_empresa",
-            "actividad_comercial",
-            "tipo_instalacion_factura",
-            "tipo_instalacion_negocio",
-            "descripcion_empresa",
-            "url_video_trayectoria",
-            "archivo_factura_id"
-        ]
-        
+        reales = []
+        for propiedad in propiedades or cls.CAMPOS_NEGOCIO:
+            for real in cls.PROPIEDADES_DERIVADAS.get(propiedad, (propiedad,)):
+                if real not in reales:
+                    reales.append(real)
+        return reales
+
+    def obtener_datos_negocio(self, id_negocio, propiedades=None, usar_precarga=False):
+        """
+        Extrae de un negocio en HubSpot solo las `propiedades` indicadas
+        (por defecto CAMPOS_NEGOCIO), en una sola llamada.
+
+        Con `usar_precarga` se consume, si existe, la lectura hecha antes con
+        precargar_negocios en lugar de llamar a la API.
+        """
+        reales = self.propiedades_a_pedir(propiedades)
+        if usar_precarga:
+            precargadas = _cache_negocios_precargados.obtener(str(id_negocio))
+            if precargadas is not None and all(real in precargadas for real in reales):
+                _cache_negocios_precargados.eliminar(str(id_negocio))
+                return self.extraer_datos(precargadas, propiedades)
+
         try:
-            respuesta_api = self.cliente.crm.deals.basic_api.get_by_id(
+            respuesta_api = obtener_api_negocios().get_by_id(
                 deal_id=id_negocio,
-                properties=campos_a_extraer,
-                archived=False
+                properties=reales,
+                archived=False,
+                _request_timeout=TIMEOUT
             )
-            
-            tipo_instalacion_factura = respuesta_api.properties.get('tipo_instalacion_factura')
-            tipo_instalacion_pdr = respuesta_api.properties.get('tipo_instalacion_pdr')
-            
-            tipo_instalacion = tipo_instalacion_factura or tipo_instalacion_pdr or ""
-            
-            datos_extraidos = {
-                'nombre_negocio': respuesta_api.properties.get('nombre_negocio'),
-                'telefono_contacto': respuesta_api.properties.get('telefono_contacto'),
-                'direccion_empresa': respuesta_api.properties.get('direccion_empresa'),
-                'actividad_comercial': respuesta_api.properties.get('actividad_comercial'),
-                'tipo_instalacion': tipo_instalacion,
-                'descripcion_empresa': respuesta_api.properties.get('descripcion_empresa'),
-                'url_video_trayectoria': respuesta_api.properties.get('url_video_trayectoria'),
-                'archivo_factura_id': respuesta_api.properties.get('archivo_factura_id')
-            }
-            
-            self.datos_negocio.update(datos_extraidos)
-            return self.datos_negocio
+            return self.extraer_datos(respuesta_api.properties, propiedades)
         
-        except ApiException as e:
+        except DealsApiException as e:
             print(f"Error API HubSpot: {e}")
             return {}
 
+    def obtener_datos_negocios(self, ids_negocios, propiedades=None):
+        """
+        Extrae las `propiedades` de varios negocios con la API batch de HubSpot
+        (una llamada por cada TAMANO_LOTE_LECTURA IDs).
+
+        Retorna:
+        - dict {id_negocio: datos}. Los negocios no encontrados no aparecen.
+        """
+        leidas = self._leer_propiedades_lote(ids_negocios, self.propiedades_a_pedir(propiedades))
+        return {id_negocio: self.extraer_datos(valores, propiedades) for id_negocio, valores in leidas.items()}
+
+    def precargar_negocios(self, ids_negocios, propiedades=None):
+        """
+        Lee con la API batch los negocios que aún no estén precargados y deja
+        sus propiedades en una caché de vida corta, para que las siguientes
+        llamadas a obtener_datos_negocio(usar_precarga=True) no vayan a la API.
+        Pensado para ráfagas de webhooks.
+
+        Retorna:
+        - int: número de negocios leídos
+        """
+        ids_pendientes = [
+            id_negocio for id_negocio in dict.fromkeys(str(i) for i in ids_negocios)
+            if _cache_negocios_precargados.obtener(id_negocio) is None
+        ]
+        leidas = self._leer_propiedades_lote(ids_pendientes, self.propiedades_a_pedir(propiedades))
+        for id_negocio, valores in leidas.items():
+            _cache_negocios_precargados.guardar(id_negocio, valores)
+        return len(leidas)
+
+    def _leer_propiedades_lote(self, ids_negocios, propiedades_reales):
+        """
+        Retorna:
+        - dict {id_negocio: {propiedad: valor}} con todas las `propiedades_reales` (None si no tienen valor)
+        """
+        leidas = {}
+        ids_negocios = [str(id_negocio) for id_negocio in ids_negocios]
+        for inicio in range(0, len(ids_negocios), self.TAMANO_LOTE_LECTURA):
+            lote = ids_negocios[inicio:inicio + self.TAMANO_LOTE_LECTURA]
+            try:
+                respuesta_api = obtener_api_negocios("batch_api").read(
+                    batch_read_input_simple_public_object_id=BatchReadInputSimplePublicObjectId(
+                        properties=propiedades_reales,
+                        properties_with_history=[],
+                        inputs=[SimplePublicObjectId(id=id_negocio) for id_negocio in lote]
+                    ),
+                    archived=False,
+                    _request_timeout=TIMEOUT
+                )
+            except DealsApiException as e:
+                print(f"Error API HubSpot (lote de {len(lote)} negocios): {e}")
+                continue
+            for negocio in respuesta_api.results:
+                leidas[str(negocio.id)] = {real: negocio.properties.get(real) for real in propiedades_reales}
+        return leidas
+
+    @classmethod
+    def extraer_datos(cls, propiedades_api, propiedades=None):
+        """
+        Convierte las propiedades devueltas por HubSpot (o las columnas de un export,
+        ver bulk_render) al diccionario de datos del negocio, con una clave por
+        propiedad pedida (derivadas incluidas).
+        """
+        datos = {}
+        for propiedad in propiedades or cls.CAMPOS_NEGOCIO:
+            origenes = cls.PROPIEDADES_DERIVADAS.get(propiedad)
+            if origenes:
+                datos[propiedad] = next((propiedades_api.get(o) for o in origenes if propiedades_api.get(o)), "")
+            else:
+                datos[propiedad] = propiedades_api.get(propiedad)
+        return datos
+
 
     def crear_nota_en_negocio(self, id_negocio, contenido_nota, id_archivo_pdf):
         """
         Crea una nota en HubSpot asociada a un negocio y adjunta un archivo PDF.
         """
-        api_key = os.getenv("API_KEY")
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
         timestamp_actual = int(time.time() * 1000)
         payload_nota = {
             "properties": {
@@ -97,11 +223,7 @@ class GestorDatosHubspot:
 
         # Crear la nota
         try:
-            respuesta = requests.post(
-                "https://api.hubapi.com/crm/v3/objects/notes",
-                headers=headers,
-                json=payload_nota
-            )
+            respuesta = peticion_hubspot("POST", "/crm/v3/objects/notes", json=payload_nota)
             respuesta.raise_for_status()
             id_nota = respuesta.json()["id"]
             print(f"✅ Nota creada con ID: {id_nota}")
@@ -109,14 +231,9 @@ class GestorDatosHubspot:
             print(f"❌ Error al crear nota con adjunto: {e}")
             return None
 
-        # Obtener el tipo de asociación válido para notas a negocios
+        # Obtener el tipo de asociación válido para notas a negocios (cacheado)
         try:
-            respuesta_asociacion = requests.get(
-                "https://api.hubapi.com/crm/v4/associations/notes/deals/labels",
-                headers=headers
-            )
-            respuesta_asociacion.raise_for_status()
-            tipo_asociacion_id = respuesta_asociacion.json()["results"][0]["typeId"]
+            tipo_asociacion_id = _cache_tipo_asociacion.obtener_o_calcular("notes_deals", _consultar_tipo_asociacion)
         except Exception as e:
             print(f"❌ Error al obtener tipo de asociación: {e}")
             return None
@@ -134,9 +251,9 @@ class GestorDatosHubspot:
         }
 
         try:
-            respuesta_final = requests.post(
-                "https://api.hubapi.com/crm/v4/associations/notes/deals/batch/create",
-                headers=headers,
+            respuesta_final = peticion_hubspot(
+                "POST",
+                "/crm/v4/associations/notes/deals/batch/create",
                 json=payload_asociacion
             )
             respuesta_final.raise_for_status()
@@ -147,31 +264,69 @@ class GestorDatosHubspot:
 
         return id_nota
 
-    def subir_pdf_desde_memoria(self, contenido_pdf_bytesio, nombre_archivo="documento.pdf"):
-        """
-        Sube un archivo PDF a HubSpot desde un objeto BytesIO y devuelve el ID y URL del archivo.
+    def subir_pdf_desde_memoria(self, contenido_pdf, nombre_archivo="documento.pdf"):
         """
-        url_subida = "https://api.hubapi.com/files/v3/files"
-        headers = {
-            "Authorization": f"Bearer {os.getenv('API_KEY')}"
-        }
-
-        archivos = {
-            "file": (nombre_archivo, contenido_pdf_bytesio, "application/pdf"),
-            "folderId": (None, "123456789012"),  # ID carpeta, ajustar según necesidad
-            "fileName": (None, nombre_archivo),
-            "options": (None, json.dumps({"access": "PRIVATE"}), "application/json")
-        }
+        Sube un archivo PDF a HubSpot desde memoria y devuelve el ID y URL del archivo.
 
-        try:
-            respuesta = requests.post(url_subida, headers=headers, files=archivos)
-            respuesta.raise_for_status()
-            datos_archivo = respuesta.json()
-            print(f"✅ Archivo subido: {datos_archivo}")
-            return datos_archivo.get("id"), datos_archivo.get("url")
-        except Exception as e:
-            print(f"❌ Error subiendo PDF: {e}")
-            return None, None
+        El contenido (bytes, memoryview o BytesIO) se envía con un cuerpo multipart
+        en streaming sin copiarlo. Ante errores de conexión, 429 o 502/503/504 se
+        reintenta desde el mismo buffer, sin volver a renderizar, hasta
+        INTENTOS_SUBIDA envíos en total. Un timeout de lectura no se reintenta:
+        HubSpot pudo haber recibido el archivo.
+        """
+        if isinstance(contenido_pdf, BytesIO):
+            contenido_pdf = contenido_pdf.getbuffer()
+
+        cuerpo = CuerpoMultipart([
+            ("file", nombre_archivo, contenido_pdf, "application/pdf"),
+            ("folderId", None, "123456789012", None),  # ID carpeta, ajustar según necesidad
+            ("fileName", None, nombre_archivo, None),
+            ("options", None, json.dumps({"access": "PRIVATE"}), "application/json"),
+        ])
+
+        ultimo_error = None
+        for intento in range(1, INTENTOS_SUBIDA + 1):
+            cuerpo.seek(0)
+            espera = FACTOR_BACKOFF * 2 ** (intento - 1)
+            try:
+                respuesta = peticion_hubspot(
+                    "POST",
+                    "/files/v3/files",
+                    reintentar=False,
+                    data=cuerpo,
+                    headers={"Content-Type": cuerpo.content_type}
+                )
+                if respuesta.status_code not in CODIGOS_REINTENTO_SUBIDA:
+                    respuesta.raise_for_status()
+                    datos_archivo = respuesta.json()
+                    print(f"✅ Archivo subido: {datos_archivo}")
+                    return datos_archivo.get("id"), datos_archivo.get("url")
+                ultimo_error = f"HTTP {respuesta.status_code}"
+                # Ante un 429 se respeta el Retry-After en segundos, como la sesión con reintentos
+                retry_after = respuesta.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    espera = max(espera, int(retry_after))
+            except requests.exceptions.ConnectionError as e:
+                # Incluye ConnectTimeout pero no ReadTimeout
+                ultimo_error = e
+            except Exception as e:
+                print(f"❌ Error subiendo PDF: {e}")
+                return None, None
+
+            if intento < INTENTOS_SUBIDA:
+                print(f"⚠️ Subida fallida ({ultimo_error}), reintento {intento}/{INTENTOS_SUBIDA - 1}")
+                time.sleep(espera)
+
+        print(f"❌ Error subiendo PDF: {ultimo_error}")
+        return None, None
+
+
+def descartar_negocio_precargado(id_negocio):
+    """
+    Olvida la lectura precargada de un negocio (por ejemplo, al llegar un
+    webhook nuevo suyo, que indica que sus propiedades cambiaron).
+    """
+    _cache_negocios_precargados.eliminar(str(id_negocio))
 
 
 def extraer_url_archivo(valor_crudo):
@@ -189,26 +344,75 @@ def extraer_url_archivo(valor_crudo):
 
     # Caso ID numérico o string numérico
     if str(valor_crudo).isdigit():
-        api_key = os.getenv("API_KEY")
-        headers = {"Authorization": f"Bearer {api_key}"}
-        url_api = f"https://api.hubapi.com/files/v3/files/{valor_crudo}"
         try:
-            respuesta = requests.get(url_api, headers=headers)
-            respuesta.raise_for_status()
-            datos_archivo = respuesta.json()
-            return datos_archivo.get("url")  # URL real del archivo
+            return _obtener_url_archivo_por_id(valor_crudo)  # URL real del archivo
         except Exception as e:
             print(f"❌ Error al obtener URL del archivo {valor_crudo}: {e}")
             return None
     return None
 
 
+def _obtener_url_archivo_por_id(id_archivo):
+    """
+    Devuelve la URL de un archivo de HubSpot, consultando la API de archivos
+    solo si no está en caché.
+    Lanza requests.exceptions.RequestException si la consulta falla.
+    """
+    url = _cache_urls_archivos.obtener(str(id_archivo))
+    if url is None:
+        respuesta = peticion_hubspot("GET", f"/files/v3/files/{id_archivo}")
+        respuesta.raise_for_status()
+        url = respuesta.json().get("url")
+        _cache_urls_archivos.guardar(str(id_archivo), url)
+    return url
+
+
+def _consultar_tipo_asociacion():
+    """
+    Consulta el typeId de la asociación notas -> negocios.
+    """
+    respuesta = peticion_hubspot("GET", "/crm/v4/associations/notes/deals/labels")
+    respuesta.raise_for_status()
+    return respuesta.json()["results"][0]["typeId"]
+
+
+def ejecutar_en_paralelo(tareas, plazo=None):
+    """
+    Ejecuta funciones sin argumentos en el pool compartido de consultas y espera
+    como máximo `plazo` segundos en total.
+
+    Parámetros:
+    - tareas (dict): clave -> callable
+    - plazo (float): segundos máximos de espera (por defecto PLAZO_CONSULTAS_SEG)
+
+    Retorna:
+    - dict clave -> resultado. Las tareas que fallan o no terminan a tiempo
+      devuelven None (resultado parcial).
+    """
+    plazo = PLAZO_CONSULTAS_SEG if plazo is None else plazo
+    futuros = {clave: _pool_consultas.submit(funcion) for clave, funcion in tareas.items()}
+    terminados, pendientes = wait(futuros.values(), timeout=plazo)
+
+    resultados = {}
+    for clave, futuro in futuros.items():
+        if futuro in pendientes:
+            futuro.cancel()
+            print(f"⏱️ Consulta {clave} sin respuesta tras {plazo}s, se omite")
+            resultados[clave] = None
+        elif futuro.exception() is not None:
+            print(f"Error en consulta {clave}: {futuro.exception()}")
+            resultados[clave] = None
+        else:
+            resultados[clave] = futuro.result()
+    return resultados
+
+
 def obtener_imagen_desde_url(url):
     """
     Descarga una imagen desde una URL y la retorna como BytesIO.
     Lanza excepción si el contenido no es una imagen válida.
     """
-    respuesta = requests.get(url)
+    respuesta = obtener_sesion().get(url, timeout=TIMEOUT)
     respuesta.raise_for_status()
 
     tipo_contenido = respuesta.headers.get("Content-Type", "")
@@ -242,24 +446,35 @@ def obtener_urls_videos_desde_ids(ids_videos_str):
     if not isinstance(ids_videos_str, str):
         return 'No hay video'
 
-    ids_videos = [vid.strip() for vid in ids_videos_str.split(";") if vid.strip()]
-    urls_videos = []
-    api_key = os.getenv("API_KEY")
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    ids_videos = _separar_ids_videos(ids_videos_str)
+    resultados = ejecutar_en_paralelo(
+        {id_video: partial(_obtener_url_archivo_por_id, id_video) for id_video in ids_videos}
+    )
+    return [resultados[id_video] for id_video in ids_videos if resultados[id_video]]
 
-    for id_video in ids_videos:
-        try:
-            respuesta = requests.get(f"https://api.hubapi.com/files/v3/files/{id_video}", headers=headers)
-            respuesta.raise_for_status()
-            datos_archivo = respuesta.json()
-            urls_videos.append(datos_archivo.get("url"))
-        except requests.exceptions.RequestException as err:
-            print(f"Error al obtener archivo {id_video}: {err}")
 
-    return urls_videos
+def resolver_videos_y_factura(ids_videos_str, valor_factura, plazo=None):
+    """
+    Resuelve en paralelo las URLs de los videos y de la factura de un negocio,
+    de modo que la latencia total sea la de la consulta más lenta.
+
+    Retorna:
+    - tuple (list, str|None): URLs de videos (en el orden de los IDs) y URL de la factura
+    """
+    ids_videos = _separar_ids_videos(ids_videos_str) if isinstance(ids_videos_str, str) else []
+    tareas = {("video", id_video): partial(_obtener_url_archivo_por_id, id_video) for id_video in ids_videos}
+    tareas["factura"] = partial(extraer_url_archivo, valor_factura)
+
+    resultados = ejecutar_en_paralelo(tareas, plazo)
+    urls_videos = [resultados[("video", id_video)] for id_video in ids_videos if resultados[("video", id_video)]]
+    return urls_videos, resultados["factura"]
+
+
+def _separar_ids_videos(ids_videos_str):
+    """
+    Separa un string de IDs separados por punto y coma, descartando vacíos.
+    """
+    return [vid.strip() for vid in ids_videos_str.split(";") if vid.strip()]
 
 
 def generar_url_previsualizacion_factura(file_id, portal_id="6613024"):
@@ -291,7 +506,7 @@ def filtrar_videos_validos(lista_urls_videos):
 
 # def crear_nota_en_negocio(self, id_negocio, contenido_nota, id_archivo_pdf):
 
-# def subir_pdf_desde_memoria(self, contenido_pdf_bytesio, nombre_archivo="documento.pdf"):
+# def subir_pdf_desde_memoria(self, contenido_pdf, nombre_archivo="documento.pdf"):
 
 # def extraer_url_archivo(self, valor_crudo):
 
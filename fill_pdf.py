@@ -1,161 +1,378 @@
 import fitz  # PyMuPDF para manipulación avanzada de PDFs
-from pdfrw import PdfReader, PdfWriter, PdfDict  # Para aplanar PDFs y eliminar campos editables
 import requests
-from io import BytesIO
-import textwrap
-import tempfile
-import os
+from collections import namedtuple
 
-# Importamos función para descargar imagenes desde URL y devolver en memoria
-from extraer_datos_hubspot import obtener_imagen_url  
+from template_cache import obtener_plantilla
+from metrics import medir_etapa
+from text_layout import ajustar_texto, FUENTE, ASCENDENTE, ALTO_LINEA, AJUSTE_POR_DEFECTO
 
+# Descarga (con caché en disco) y reescalado de imágenes antes de insertarlas
+from image_pipeline import preparar_imagen
 
-def generar_pdfs_en_memoria(ruta_plantilla_pdf, datos_cliente):
+
+# Variantes de salida que puede pedir el llamador
+VARIANTE_EDITABLE = "editable"
+VARIANTE_APLANADA = "aplanado"
+VARIANTES_TODAS = (VARIANTE_EDITABLE, VARIANTE_APLANADA)
+
+# Tipos de render de un campo en la versión aplanada
+TIPO_TEXTO = "texto"
+TIPO_IMAGEN = "imagen"
+TIPO_ENLACE_VIDEO = "enlace_video"
+TIPO_ENLACE_FACTURA = "enlace_factura"
+
+# Lo que se dibujó para un campo en una página: streams de contenido y enlaces añadidos
+CapaCampo = namedtuple("CapaCampo", ["pagina", "contenidos", "enlaces"])
+
+
+def generar_pdfs_en_memoria(ruta_plantilla_pdf, datos_cliente, variantes=VARIANTES_TODAS, capas=None, tipos_campos=None, ajustes_campos=None,
+                            campos_fallidos=None):
     """
-    Genera dos versiones de un PDF en memoria a partir de una plantilla:
+    Genera en memoria, a partir de una plantilla, las versiones pedidas del PDF:
     - PDF editable con campos rellenados con datos del cliente
     - PDF aplanado (no editable), con textos e imágenes incrustadas
 
+    Solo se construyen las variantes incluidas en `variantes`; la plantilla se
+    toma de la caché del proceso (ver template_cache) y todo ocurre sobre
+    documentos en memoria, sin archivos temporales.
+
     Parámetros:
     - ruta_plantilla_pdf (str): ruta local al archivo PDF plantilla
     - datos_cliente (dict): diccionario con los datos a insertar en el PDF
+    - variantes (iterable): VARIANTE_EDITABLE y/o VARIANTE_APLANADA (por defecto ambas)
+    - capas (dict): si se indica, se rellena con las CapaCampo dibujadas por campo en
+      la versión aplanada, para poder parchearla después (ver parchear_pdf_aplanado)
+    - tipos_campos (dict): tipo de render por campo (ver template_registry); los campos
+      sin tipo declarado lo deducen de su valor
+    - ajustes_campos (dict): AjusteTexto por campo para los textos que no caben
+      (por defecto AJUSTE_POR_DEFECTO, ver text_layout)
+    - campos_fallidos (list): si se indica, se añaden los campos de la versión aplanada
+      que no se pudieron dibujar (imagen que no se descargó, enlace inválido...)
 
     Retorna:
-    - tuple (BytesIO, BytesIO): PDF editable y PDF no editable en memoria
+    - tuple (bytes | None, bytes | None): PDF editable y PDF no editable en memoria;
+      None en la variante no pedida. Se devuelven los bytes serializados tal cual
+      (sin copiarlos a otro buffer) para pasarlos directamente a la subida.
+    """
+    variantes_desconocidas = set(variantes) - set(VARIANTES_TODAS)
+    if variantes_desconocidas:
+        raise ValueError(f"Variantes de PDF desconocidas: {sorted(variantes_desconocidas)}")
+
+    with medir_etapa("cargar_plantilla"):
+        plantilla = obtener_plantilla(ruta_plantilla_pdf)
+    pdf_editable_en_memoria = pdf_no_editable_en_memoria = None
+
+    # Paso 1: rellenar campos editables con datos del cliente
+    if VARIANTE_EDITABLE in variantes:
+        documento_editable = plantilla.abrir()
+        try:
+            with medir_etapa("rellenar_campos_editables"):
+                _rellenar_campos_editables(documento_editable, datos_cliente, plantilla)
+                pdf_editable_en_memoria = documento_editable.tobytes()
+        finally:
+            documento_editable.close()
+
+    # Paso 2: generar versión aplanada con imágenes y textos incrustados
+    if VARIANTE_APLANADA in variantes:
+        documento_aplanado = plantilla.abrir()
+        try:
+            with medir_etapa("insertar_imagenes_y_textos"):
+                fallidos = _insertar_imagenes_y_textos(documento_aplanado, datos_cliente, plantilla, capas, tipos_campos, ajustes_campos)
+            if campos_fallidos is not None:
+                campos_fallidos.extend(fallidos)
+            with medir_etapa("aplanar"):
+                _eliminar_campos_editables_pdf(documento_aplanado, plantilla)
+                pdf_no_editable_en_memoria = documento_aplanado.tobytes(garbage=1)
+        finally:
+            documento_aplanado.close()
+
+    return pdf_editable_en_memoria, pdf_no_editable_en_memoria
+
+
+def parchear_pdf_aplanado(ruta_plantilla_pdf, contenido, capas, datos_cliente, campos_cambiados, tipos_campos=None, ajustes_campos=None,
+                          campos_fallidos=None):
     """
+    Actualiza un PDF aplanado ya generado redibujando solo `campos_cambiados`:
+    se quitan de la página los streams y enlaces que se dibujaron para esos
+    campos y se insertan sus valores nuevos. El resto del documento
+    (imágenes incluidas) se reutiliza tal cual.
 
-    # Archivos temporales para guardar versiones intermedias del PDF
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_editable_file, \
-         tempfile.NamedTemporaryFile(suffix=".tmp.pdf", delete=False) as pdf_temp_file, \
-         tempfile.NamedTemporaryFile(suffix=".final.pdf", delete=False) as pdf_final_file:
+    Parámetros:
+    - ruta_plantilla_pdf (str): plantilla con la que se generó `contenido`
+    - contenido (bytes): PDF aplanado generado con la misma plantilla
+    - capas (dict): CapaCampo por campo registradas al generar `contenido`
+    - datos_cliente (dict): datos completos del negocio
+    - campos_cambiados (iterable): campos a redibujar (los ausentes en `datos_cliente` se borran)
+    - tipos_campos (dict): tipo de render por campo
+    - ajustes_campos (dict): AjusteTexto por campo
+    - campos_fallidos (list): si se indica, se añaden los campos que no se pudieron dibujar
 
-        ruta_pdf_editable = pdf_editable_file.name
-        ruta_pdf_temporal = pdf_temp_file.name
-        ruta_pdf_final = pdf_final_file.name
+    Retorna:
+    - tuple (bytes, dict): PDF aplanado actualizado y sus capas
+    """
+    plantilla = obtener_plantilla(ruta_plantilla_pdf)
+    campos_cambiados = set(campos_cambiados)
+    capas_nuevas = {campo: lista for campo, lista in capas.items() if campo not in campos_cambiados}
 
+    documento = fitz.open(stream=contenido, filetype="pdf")
     try:
-        # Paso 1: rellenar campos editables con datos del cliente
-        _rellenar_campos_editables(ruta_plantilla_pdf, datos_cliente, ruta_pdf_editable)
+        # Quitar lo dibujado para los campos que cambian
+        contenidos_a_quitar = {}
+        for campo in campos_cambiados:
+            for capa in capas.get(campo, ()):
+                contenidos_a_quitar.setdefault(capa.pagina, set()).update(capa.contenidos)
+                for xref in capa.enlaces:
+                    documento[capa.pagina].delete_link({"xref": xref})
+        for numero_pagina, xrefs in contenidos_a_quitar.items():
+            pagina = documento[numero_pagina]
+            restantes = " ".join(f"{xref} 0 R" for xref in pagina.get_contents() if xref not in xrefs)
+            documento.xref_set_key(pagina.xref, "Contents", f"[{restantes}]")
 
-        # Cargamos PDF editable en memoria
-        with open(ruta_pdf_editable, "rb") as f:
-            pdf_editable_en_memoria = BytesIO(f.read())
+        # Dibujar solo los valores nuevos
+        datos_cambiados = {campo: datos_cliente[campo] for campo in campos_cambiados if campo in datos_cliente}
+        fallidos = _insertar_imagenes_y_textos(documento, datos_cambiados, plantilla, capas_nuevas, tipos_campos, ajustes_campos)
+        if campos_fallidos is not None:
+            campos_fallidos.extend(fallidos)
+        return documento.tobytes(garbage=1), capas_nuevas
+    finally:
+        documento.close()
+
+
+def generar_paginas_aplanadas(ruta_plantilla_pdf, datos_cliente, desde, hasta, tipos_campos=None, ajustes_campos=None):
+    """
+    Dibuja y aplana solo las páginas `desde`..`hasta` (ambas incluidas) de la
+    plantilla y las devuelve como un PDF aparte, para renderizar un documento
+    por tramos de páginas en procesos distintos (ver render_paralelo).
+
+    Retorna:
+    - tuple (bytes, list): PDF con las páginas del tramo y campos que no se
+      pudieron dibujar
+    """
+    plantilla = obtener_plantilla(ruta_plantilla_pdf)
+    documento = plantilla.abrir()
+    tramo = fitz.open()
+    try:
+        fallidos = _insertar_imagenes_y_textos(
+            documento, datos_cliente, plantilla,
+            tipos_campos=tipos_campos, ajustes_campos=ajustes_campos, paginas=range(desde, hasta + 1),
+        )
+        _eliminar_campos_editables_pdf(documento, plantilla)
+        tramo.insert_pdf(documento, from_page=desde, to_page=hasta)
+        return tramo.tobytes(garbage=1), fallidos
+    finally:
+        tramo.close()
+        documento.close()
 
-        # Paso 2: generar versión aplanada con imágenes y textos incrustados
-        _insertar_imagenes_y_textos(ruta_plantilla_pdf, datos_cliente, ruta_pdf_temporal)
-        _eliminar_campos_editables_pdf(ruta_pdf_temporal, ruta_pdf_final)
 
-        # Cargamos PDF final no editable en memoria
-        with open(ruta_pdf_final, "rb") as f:
-            pdf_no_editable_en_memoria = BytesIO(f.read())
+def unir_paginas_aplanadas(ruta_plantilla_pdf, tramos):
+    """
+    Sustituye en la plantilla los tramos de páginas ya aplanados por
+    generar_paginas_aplanadas y devuelve el documento completo aplanado.
 
-        return pdf_editable_en_memoria, pdf_no_editable_en_memoria
+    Parámetros:
+    - tramos (list[tuple]): (primera_pagina, ultima_pagina, bytes del tramo)
 
+    Retorna:
+    - bytes: PDF aplanado
+    """
+    plantilla = obtener_plantilla(ruta_plantilla_pdf)
+    documento = plantilla.abrir()
+    try:
+        # De atrás hacia delante para que los números de página sigan siendo válidos
+        for desde, hasta, contenido in sorted(tramos, reverse=True):
+            tramo = fitz.open(stream=contenido, filetype="pdf")
+            documento.delete_pages(desde, hasta)
+            documento.insert_pdf(tramo, start_at=desde)
+            tramo.close()
+        _eliminar_campos_editables_pdf(documento, plantilla)
+        return documento.tobytes(garbage=1)
     finally:
-        # Limpieza de archivos temporales para evitar dejar rastros en disco
-        for ruta in (ruta_pdf_editable, ruta_pdf_temporal, ruta_pdf_final):
-            try:
-                os.unlink(ruta)
-            except Exception as e:
-                print(f"⚠️ No se pudo eliminar archivo temporal {ruta}: {e}")
+        documento.close()
 
 
-def _rellenar_campos_editables(ruta_plantilla, datos, ruta_salida):
+def _rellenar_campos_editables(documento, datos, plantilla):
     """
     Rellena campos editables (widgets) en el PDF plantilla con los datos proporcionados.
+    Solo se recorren las páginas que contienen campos presentes en `datos`.
 
     Parámetros:
-    - ruta_plantilla (str): ruta al PDF plantilla
+    - documento (fitz.Document): plantilla abierta en memoria, se modifica en sitio
     - datos (dict): datos para insertar en los campos
-    - ruta_salida (str): ruta donde guardar el PDF editado
+    - plantilla (PlantillaPdf): índice de campos de la plantilla
     """
-    documento = fitz.open(ruta_plantilla)
-    for pagina in documento:
-        widgets = pagina.widgets()
-        if not widgets:
-            continue
-        for widget in widgets:
+    for numero_pagina in plantilla.campos_por_pagina(datos):
+        for widget in documento[numero_pagina].widgets():
             nombre_campo = widget.field_name
             if nombre_campo in datos:
                 widget.field_value = str(datos[nombre_campo])
                 widget.update()
-    documento.save(ruta_salida)
-    documento.close()
 
 
-def _insertar_imagenes_y_textos(ruta_pdf, datos, ruta_salida):
+def _insertar_imagenes_y_textos(documento, datos, plantilla, capas=None, tipos_campos=None, ajustes_campos=None, paginas=None):
     """
     Inserta imágenes y textos directamente en el PDF en las posiciones de los campos,
     para generar una versión visual que no depende de campos editables.
+    Las posiciones salen del índice precalculado de la plantilla.
 
     Parámetros:
-    - ruta_pdf (str): PDF original plantilla
+    - documento (fitz.Document): plantilla abierta en memoria, se modifica en sitio
     - datos (dict): datos con URLs o textos a insertar
-    - ruta_salida (str): archivo donde guardar PDF modificado
+    - plantilla (PlantillaPdf): índice de campos de la plantilla
+    - capas (dict): si se indica, se añade la CapaCampo de cada campo dibujado
+    - tipos_campos (dict): tipo de render por campo
+    - ajustes_campos (dict): AjusteTexto por campo
+    - paginas (iterable): si se indica, solo se dibuja en esas páginas (ver render_paralelo)
+
+    Retorna:
+    - list: campos que no se pudieron dibujar (el resto del documento se genera igual)
     """
-    documento = fitz.open(ruta_pdf)
-    for pagina in documento:
-        widgets = pagina.widgets()
-        if not widgets:
+    # URL de imagen -> xref ya incrustado, para no duplicar imágenes repetidas
+    xrefs_imagenes = {}
+    fallidos = []
+    for numero_pagina, campos in plantilla.campos_por_pagina(datos).items():
+        if paginas is not None and numero_pagina not in paginas:
             continue
-        for widget in widgets:
-            nombre_campo = widget.field_name
-            if nombre_campo in datos:
-                valor = datos[nombre_campo]
-                rect = widget.rect
-                # Insertar imagen si es URL válida a imagen
-                if isinstance(valor, str) and valor.startswith("https") and any(valor.endswith(ext) for ext in [".jpg", ".jpeg", ".png", ".FLAG_IMAGEN"]):
-                    try:
-                        flujo_imagen = obtener_imagen_url(valor)
-                        pagina.insert_image(rect, stream=flujo_imagen, keep_proportion=True)
-                    except Exception as e:
-                        print(f"Error al insertar imagen desde {valor}: {e}")
-                # Insertar enlace y texto para videos
-                elif isinstance(valor, str) and valor.lower().endswith((".mp4", ".mov", ".avi", ".mkv")):
-                    try:
-                        texto_enlaces = "\n".join(textwrap.wrap(valor, width=80))
-                        pagina.insert_textbox(rect, texto_enlaces, fontname="helv", fontsize=8, color=(0, 0, 1), align=0)
-                        zona_enlace = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + 12)
-                        pagina.insert_link({"kind": fitz.LINK_URI, "from": zona_enlace, "uri": valor})
-                    except Exception as e:
-                        print(f"Error al insertar enlace de video desde {valor}: {e}")
-                # Insertar enlace y texto para URLs de factura (preview en HubSpot)
-                elif isinstance(valor, str) and valor.startswith("https://app.hubspot.com/file-preview/"):
-                    try:
-                        texto_enlaces = "\n".join(textwrap.wrap(valor, width=40))
-                        pagina.insert_textbox(rect, texto_enlaces, fontname="helv", fontsize=8, color=(0, 0, 1), align=0)
-                        zona_enlace = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + 12)
-                        pagina.insert_link({"kind": fitz.LINK_URI, "from": zona_enlace, "uri": valor})
-                    except Exception as e:
-                        print(f"Error al insertar enlace de factura: {e}")
-                # Para otros campos solo insertar texto plano
-                else:
-                    widget.field_value = str(valor)
-                    widget.update()
-                    pagina.insert_textbox(rect, str(valor), fontname="helv", fontsize=8, color=(0, 0, 0), align=0)
-    documento.save(ruta_salida)
-    documento.close()
-
-
-def _eliminar_campos_editables_pdf(ruta_entrada, ruta_salida):
-    """
-    Aplana un PDF eliminando todos los campos editables y anotaciones,
+        pagina = documento[numero_pagina]
+        if capas is not None:
+            # Con el estado gráfico ya equilibrado cada inserción añade solo sus propios streams
+            pagina.wrap_contents()
+        for nombre_campo, rect in campos:
+            valor = datos[nombre_campo]
+            tipo = tipo_campo(nombre_campo, valor, tipos_campos)
+            ajuste = ajustes_campos.get(nombre_campo, AJUSTE_POR_DEFECTO) if ajustes_campos else AJUSTE_POR_DEFECTO
+            if capas is None:
+                if not _insertar_valor(pagina, rect, valor, tipo, xrefs_imagenes, ajuste):
+                    fallidos.append(nombre_campo)
+                continue
+            contenidos_previos = set(pagina.get_contents())
+            enlaces_previos = set(_xrefs_enlaces(pagina))
+            if not _insertar_valor(pagina, rect, valor, tipo, xrefs_imagenes, ajuste):
+                fallidos.append(nombre_campo)
+            capas.setdefault(nombre_campo, []).append(CapaCampo(
+                numero_pagina,
+                tuple(xref for xref in pagina.get_contents() if xref not in contenidos_previos),
+                tuple(xref for xref in _xrefs_enlaces(pagina) if xref not in enlaces_previos),
+            ))
+    return fallidos
+
+
+def _xrefs_enlaces(pagina):
+    return [xref for xref, tipo, _ in pagina.annot_xrefs() if tipo == fitz.PDF_ANNOT_LINK]
+
+
+def tipo_campo(nombre_campo, valor, tipos_campos=None):
+    """
+    Tipo de render de un campo: el declarado en `tipos_campos` o, si no hay,
+    el que se deduce del valor.
+    """
+    tipo = tipos_campos.get(nombre_campo) if tipos_campos else None
+    return tipo or inferir_tipo(valor)
+
+
+def inferir_tipo(valor):
+    """
+    Deduce el tipo de render a partir del propio valor (URL de imagen,
+    URL de video, previsualización de factura o texto).
+    """
+    if not isinstance(valor, str):
+        return TIPO_TEXTO
+    if valor.startswith(("http://", "https://")) and valor.endswith((".jpg", ".jpeg", ".png", ".FLAG_IMAGEN")):
+        return TIPO_IMAGEN
+    if valor.lower().endswith((".mp4", ".mov", ".avi", ".mkv")):
+        return TIPO_ENLACE_VIDEO
+    if valor.startswith("https://app.hubspot.com/file-preview/"):
+        return TIPO_ENLACE_FACTURA
+    return TIPO_TEXTO
+
+
+def _insertar_valor(pagina, rect, valor, tipo, xrefs_imagenes, ajuste=AJUSTE_POR_DEFECTO):
+    """
+    Dibuja un valor en `rect` según su tipo: imagen, enlace de video,
+    enlace de factura o texto plano. Los textos se maquetan con `ajuste`
+    para que quepan en el rectángulo a la primera.
+
+    Retorna:
+    - bool: False si la imagen o el enlace no se pudieron dibujar
+    """
+    # Campos vacíos (sin foto, sin video...) no dibujan nada
+    if valor is None or valor == "":
+        return True
+    # Insertar imagen desde su URL
+    if tipo == TIPO_IMAGEN:
+        try:
+            if valor in xrefs_imagenes:
+                pagina.insert_image(rect, xref=xrefs_imagenes[valor], keep_proportion=True)
+            else:
+                imagen = preparar_imagen(valor, rect)
+                xrefs_imagenes[valor] = pagina.insert_image(rect, stream=imagen, keep_proportion=True)
+        except Exception as e:
+            print(f"Error al insertar imagen desde {valor}: {e}")
+            return False
+    # Insertar enlace y texto para videos
+    elif tipo == TIPO_ENLACE_VIDEO:
+        try:
+            zona_enlace = _insertar_texto(pagina, rect, valor, (0, 0, 1), ajuste)
+            pagina.insert_link({"kind": fitz.LINK_URI, "from": zona_enlace, "uri": valor})
+        except Exception as e:
+            print(f"Error al insertar enlace de video desde {valor}: {e}")
+            return False
+    # Insertar enlace y texto para URLs de factura (preview en HubSpot)
+    elif tipo == TIPO_ENLACE_FACTURA:
+        try:
+            zona_enlace = _insertar_texto(pagina, rect, valor, (0, 0, 1), ajuste)
+            pagina.insert_link({"kind": fitz.LINK_URI, "from": zona_enlace, "uri": valor})
+        except Exception as e:
+            print(f"Error al insertar enlace de factura: {e}")
+            return False
+    # Para otros campos solo insertar texto plano
+    else:
+        _insertar_texto(pagina, rect, str(valor), (0, 0, 0), ajuste)
+    return True
+
+
+def _insertar_texto(pagina, rect, texto, color, ajuste):
+    """
+    Dibuja el texto ya maquetado (ver text_layout.ajustar_texto) desde la
+    esquina superior izquierda de `rect`.
+
+    Retorna:
+    - fitz.Rect: zona ocupada por las líneas dibujadas
+    """
+    ajustado = ajustar_texto(texto, rect.width, rect.height, ajuste)
+    alto_linea = ajustado.tamano * ALTO_LINEA
+    pagina.insert_text(
+        (rect.x0, rect.y0 + ajustado.tamano * ASCENDENTE),
+        "\n".join(ajustado.lineas),
+        fontname=FUENTE,
+        fontsize=ajustado.tamano,
+        lineheight=ALTO_LINEA,
+        color=color,
+    )
+    return fitz.Rect(rect.x0, rect.y0, rect.x1, min(rect.y1, rect.y0 + alto_linea * len(ajustado.lineas)))
+
+
+def _eliminar_campos_editables_pdf(documento, plantilla):
+    """
+    Aplana un PDF eliminando todos los campos editables,
     para generar una versión no editable.
 
+    Los enlaces insertados sobre la página se conservan.
+
     Parámetros:
-    - ruta_entrada (str): PDF con campos editables
-    - ruta_salida (str): PDF sin campos editables
-    """
-    pdf = PdfReader(ruta_entrada)
-    if "/AcroForm" in pdf.Root:
-        # Limpiamos lista de campos para que no existan más
-        pdf.Root.AcroForm.update(PdfDict(Fields=[]))
-    for pagina in pdf.pages:
-        if "/Annots" in pagina:
-            # Eliminamos todas las anotaciones (campos, comentarios)
-            pagina.Annots = []
-    PdfWriter(ruta_salida, trailer=pdf).write()
-
-
-# Nota: para utilizar este módulo se recomienda instalar PyMuPDF y pdfrw:
-# pip install pymupdf pdfrw
+    - documento (fitz.Document): PDF con campos editables, se modifica en sitio
+    - plantilla (PlantillaPdf): índice con las páginas que tienen campos
+    """
+    for numero_pagina in plantilla.paginas_con_campos:
+        pagina = documento[numero_pagina]
+        # Eliminamos los widgets uno a uno (delete_widget devuelve el siguiente)
+        widget = pagina.first_widget
+        while widget:
+            widget = pagina.delete_widget(widget)
+    # Limpiamos el formulario para que no queden referencias a los campos
+    catalogo = documento.pdf_catalog()
+    if documento.xref_get_key(catalogo, "AcroForm")[0] != "null":
+        documento.xref_set_key(catalogo, "AcroForm", "null")
+
+
+# Nota: para utilizar este módulo se recomienda instalar PyMuPDF:
+# pip install pymupdf
@@ -0,0 +1,233 @@
+import os
+import uuid
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import hubspot
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuración del transporte compartido con HubSpot
+URL_BASE_HUBSPOT = os.getenv("HUBSPOT_URL_BASE", "https://api.hubapi.com").rstrip("/")
+TIMEOUT_CONEXION_SEG = float(os.getenv("HUBSPOT_TIMEOUT_CONEXION_SEG", "3.05"))
+TIMEOUT_LECTURA_SEG = float(os.getenv("HUBSPOT_TIMEOUT_LECTURA_SEG", "20"))
+TIMEOUT = (TIMEOUT_CONEXION_SEG, TIMEOUT_LECTURA_SEG)
+REINTENTOS_MAX = int(os.getenv("HUBSPOT_REINTENTOS_MAX", "4"))
+FACTOR_BACKOFF = float(os.getenv("HUBSPOT_FACTOR_BACKOFF", "0.5"))
+TAMANO_POOL_CONEXIONES = int(os.getenv("HUBSPOT_TAMANO_POOL", "20"))
+CODIGOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+
+class _ReintentoHubspot(Retry):
+    """
+    Política de reintentos con backoff exponencial que respeta Retry-After.
+    Los POST solo se repiten ante 429: con un 5xx no sabemos si HubSpot
+    llegó a crear la nota o el archivo y preferimos no duplicarlos.
+
+    Excepción consciente: la subida de PDFs (subir_pdf_desde_memoria) va por
+    una sesión sin reintentos (ver peticion_hubspot) y hace los suyos propios
+    ante errores de conexión, 429 y 502/503/504, que casi siempre indican que
+    la petición no llegó a HubSpot. Si aun así se hubiera creado, el duplicado
+    es un archivo huérfano que ninguna nota referencia, un coste menor que
+    perder el documento. Los timeouts de lectura y el resto de 5xx no se
+    reintentan.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST":
+            return status_code == 429 and bool(self.total)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def crear_reintentos():
+    """
+    Devuelve la política de reintentos usada por la sesión y por el cliente SDK.
+    """
+    return _ReintentoHubspot(
+        total=REINTENTOS_MAX,
+        backoff_factor=FACTOR_BACKOFF,
+        status_forcelist=CODIGOS_REINTENTABLES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+class CuerpoMultipart:
+    """
+    Cuerpo multipart/form-data que se lee por trozos directamente sobre los
+    buffers recibidos (memoryview), sin concatenar ni copiar el contenido.
+
+    Implementa read/seek/tell/__len__ para que requests envíe Content-Length
+    y urllib3 pueda rebobinarlo si reintenta la petición.
+
+    Parámetros:
+    - campos (list): tuplas (nombre, nombre_archivo | None, contenido, content_type | None);
+      el contenido puede ser str, bytes, bytearray o memoryview
+    """
+
+    TAMANO_TROZO = 64 * 1024
+
+    def __init__(self, campos):
+        self.boundary = uuid.uuid4().hex
+        self._partes = []
+        for nombre, nombre_archivo, contenido, tipo_contenido in campos:
+            cabecera = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{nombre}"'
+            if nombre_archivo:
+                cabecera += f'; filename="{nombre_archivo}"'
+            cabecera += "\r\n"
+            if tipo_contenido:
+                cabecera += f"Content-Type: {tipo_contenido}\r\n"
+            cabecera += "\r\n"
+            if isinstance(contenido, str):
+                contenido = contenido.encode("utf-8")
+            self._partes.append(memoryview(cabecera.encode("utf-8")))
+            self._partes.append(memoryview(contenido).cast("B"))
+            self._partes.append(memoryview(b"\r\n"))
+        self._partes.append(memoryview(f"--{self.boundary}--\r\n".encode("utf-8")))
+        self._longitud = sum(parte.nbytes for parte in self._partes)
+        self._posicion = 0
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._longitud
+
+    def tell(self):
+        return self._posicion
+
+    def seek(self, desplazamiento, desde=0):
+        base = {0: 0, 1: self._posicion, 2: self._longitud}[desde]
+        self._posicion = min(max(0, base + desplazamiento), self._longitud)
+        return self._posicion
+
+    def read(self, tamano=-1):
+        """
+        Devuelve el siguiente trozo como memoryview (sin copia). Un trozo nunca
+        cruza el límite entre partes, por lo que puede ser menor que `tamano`.
+        """
+        if tamano is None or tamano < 0:
+            tamano = self._longitud
+        inicio_parte = 0
+        for parte in self._partes:
+            fin_parte = inicio_parte + parte.nbytes
+            if self._posicion < fin_parte:
+                desde = self._posicion - inicio_parte
+                trozo = parte[desde:desde + tamano]
+                self._posicion += trozo.nbytes
+                return trozo
+            inicio_parte = fin_parte
+        return memoryview(b"")
+
+    def __iter__(self):
+        while True:
+            trozo = self.read(self.TAMANO_TROZO)
+            if not trozo:
+                return
+            yield trozo
+
+
+_sesion = None
+_sesion_sin_reintentos = None
+_cliente = None
+_apis = {}
+_candado = threading.RLock()
+
+
+def _crear_sesion(reintentos):
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(
+        pool_connections=TAMANO_POOL_CONEXIONES,
+        pool_maxsize=TAMANO_POOL_CONEXIONES,
+        max_retries=reintentos,
+    )
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+def obtener_sesion(reintentar=True):
+    """
+    Sesión HTTP compartida por el proceso, con pool de conexiones keep-alive
+    y reintentos. Se crea la primera vez que se necesita.
+
+    Con `reintentar=False` devuelve una segunda sesión compartida que nunca
+    reintenta, para los llamadores con su propia política de reintentos.
+    """
+    global _sesion, _sesion_sin_reintentos
+    if reintentar:
+        if _sesion is None:
+            with _candado:
+                if _sesion is None:
+                    _sesion = _crear_sesion(crear_reintentos())
+        return _sesion
+    if _sesion_sin_reintentos is None:
+        with _candado:
+            if _sesion_sin_reintentos is None:
+                _sesion_sin_reintentos = _crear_sesion(Retry(0, read=False))
+    return _sesion_sin_reintentos
+
+
+def cabeceras_hubspot(json=False):
+    """
+    Cabeceras de autenticación para la API de HubSpot.
+    """
+    headers = {"Authorization": f"Bearer {os.getenv('API_KEY')}"}
+    if json:
+        headers["Content-Type"] = "application/json"
+    return headers
+
+
+def peticion_hubspot(metodo, ruta, reintentar=True, **kwargs):
+    """
+    Envía una petición a la API de HubSpot por la sesión compartida.
+
+    Parámetros:
+    - metodo (str): "GET", "POST", ...
+    - ruta (str): ruta relativa a URL_BASE_HUBSPOT (ej. "/files/v3/files/123")
+    - reintentar (bool): False para enviarla una sola vez (el llamador reintenta)
+    - kwargs: argumentos de requests; si no se indica `timeout` se usa TIMEOUT
+
+    Retorna:
+    - requests.Response (sin llamar a raise_for_status)
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    headers = cabeceras_hubspot(json="json" in kwargs)
+    headers.update(kwargs.pop("headers", None) or {})
+    return obtener_sesion(reintentar).request(metodo, f"{URL_BASE_HUBSPOT}{ruta}", headers=headers, **kwargs)
+
+
+def obtener_cliente_hubspot():
+    """
+    Cliente del SDK de HubSpot compartido por el proceso.
+    """
+    global _cliente
+    if _cliente is None:
+        with _candado:
+            if _cliente is None:
+                _cliente = hubspot.Client.create(
+                    access_token=os.getenv("API_KEY"),
+                    retry=crear_reintentos(),
+                    host=URL_BASE_HUBSPOT,
+                )
+    return _cliente
+
+
+def obtener_api_negocios(nombre_api="basic_api"):
+    """
+    Devuelve una API de negocios del SDK (basic_api, batch_api...) reutilizable.
+    Cada acceso a `cliente.crm.deals.<api>` crea un ApiClient con su propio
+    pool de conexiones, por eso se guarda una sola instancia por proceso.
+    """
+    api = _apis.get(nombre_api)
+    if api is None:
+        with _candado:
+            api = _apis.get(nombre_api)
+            if api is None:
+                api = getattr(obtener_cliente_hubspot().crm.deals, nombre_api)
+                _apis[nombre_api] = api
+    return api
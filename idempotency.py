@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Índice local de documentos ya subidos por negocio
+HUELLAS_SQLITE_RUTA = os.getenv("HUELLAS_SQLITE_RUTA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "huellas_documentos.sqlite3"))
+OMITIR_SIN_CAMBIOS = os.getenv("PDF_OMITIR_SIN_CAMBIOS", "1") == "1"
+
+
+def calcular_huella(pdf_data, version_plantilla):
+    """
+    Huella del documento: hash de los campos del PDF (que ya incluyen las URLs
+    resueltas de videos, factura e imágenes) y de la versión de la plantilla.
+    """
+    contenido = json.dumps(
+        {"plantilla": version_plantilla, "datos": pdf_data},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+class IndiceHuellas:
+    """
+    Guarda, por negocio, la huella del último documento subido junto con el
+    ID y la URL del archivo en HubSpot.
+    """
+
+    def __init__(self, ruta=HUELLAS_SQLITE_RUTA):
+        self.ruta = ruta
+        self._local = threading.local()
+        with self._conexion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS documentos ("
+                " hubspot_id TEXT PRIMARY KEY, huella TEXT NOT NULL,"
+                " file_id TEXT NOT NULL, file_url TEXT, actualizado REAL NOT NULL)"
+            )
+
+    def _conexion(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=10)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def buscar(self, hubspot_id, huella):
+        """
+        Retorna:
+        - tuple (file_id, file_url) si el último documento del negocio tiene esta huella, o None
+        """
+        fila = self._conexion().execute(
+            "SELECT file_id, file_url FROM documentos WHERE hubspot_id = ? AND huella = ?",
+            (str(hubspot_id), huella),
+        ).fetchone()
+        return tuple(fila) if fila else None
+
+    def guardar(self, hubspot_id, huella, file_id, file_url):
+        with self._conexion() as conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO documentos (hubspot_id, huella, file_id, file_url, actualizado)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (str(hubspot_id), huella, str(file_id), file_url, time.time()),
+            )
+
+
+_indice = None
+_candado = threading.Lock()
+
+
+def obtener_indice_huellas():
+    """
+    Índice compartido por el proceso (se crea la primera vez que se usa).
+    """
+    global _indice
+    with _candado:
+        if _indice is None:
+            _indice = IndiceHuellas()
+    return _indice
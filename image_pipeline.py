@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+import tempfile
+
+import fitz  # PyMuPDF para decodificar y reescalar imágenes
+from dotenv import load_dotenv
+
+from hubspot_http import TIMEOUT, obtener_sesion
+
+load_dotenv()
+
+# Configuración del pipeline de imágenes
+IMAGENES_CACHE_DIR = os.getenv("IMAGENES_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hubspot_pdf_imagenes"))
+IMAGENES_DPI = float(os.getenv("IMAGENES_DPI", "150"))
+IMAGENES_CALIDAD_JPEG = int(os.getenv("IMAGENES_CALIDAD_JPEG", "80"))
+
+
+def _ruta_cache(*partes):
+    ruta = os.path.join(IMAGENES_CACHE_DIR, *partes)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    return ruta
+
+
+def _escribir_atomico(ruta, contenido):
+    # Escribimos en un temporal y renombramos para que otro worker nunca lea un archivo a medias.
+    # El temporal es único por llamada: varios hilos del mismo proceso pueden escribir la misma ruta
+    descriptor, ruta_tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix=os.path.basename(ruta) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(contenido)
+        os.replace(ruta_tmp, ruta)
+    except BaseException:
+        try:
+            os.remove(ruta_tmp)
+        except OSError:
+            pass
+        raise
+
+
+def descargar_imagen(url):
+    """
+    Descarga una imagen usando una caché en disco direccionada por contenido.
+
+    Para cada URL se guarda su ETag y el hash del contenido; si ya la tenemos,
+    se hace una petición condicional (If-None-Match) y ante un 304 se reutiliza
+    el archivo en disco.
+
+    Retorna:
+    - tuple (str, bytes): hash sha256 del contenido y bytes de la imagen
+
+    Lanza excepción si el contenido no es una imagen válida.
+    """
+    clave_url = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    ruta_meta = _ruta_cache("urls", f"{clave_url}.json")
+
+    meta = None
+    try:
+        with open(ruta_meta, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(_ruta_cache("blobs", meta["hash"]), "rb") as f:
+            contenido_cacheado = f.read()
+    except (OSError, ValueError, KeyError):
+        meta = None
+
+    headers = {}
+    if meta and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+
+    respuesta = obtener_sesion().get(url, headers=headers, timeout=TIMEOUT)
+    if respuesta.status_code == 304 and meta:
+        return meta["hash"], contenido_cacheado
+    respuesta.raise_for_status()
+
+    tipo_contenido = respuesta.headers.get("Content-Type", "")
+    if not tipo_contenido.startswith("image/"):
+        raise ValueError(f"La URL no es una imagen válida. Content-Type: {tipo_contenido}")
+
+    contenido = respuesta.content
+    hash_contenido = hashlib.sha256(contenido).hexdigest()
+    ruta_blob = _ruta_cache("blobs", hash_contenido)
+    if not os.path.exists(ruta_blob):
+        _escribir_atomico(ruta_blob, contenido)
+    if respuesta.headers.get("ETag"):
+        meta = {"etag": respuesta.headers["ETag"], "hash": hash_contenido}
+        _escribir_atomico(ruta_meta, json.dumps(meta).encode("utf-8"))
+    return hash_contenido, contenido
+
+
+def reescalar_imagen(contenido, rect, dpi=IMAGENES_DPI):
+    """
+    Reduce una imagen al tamaño en píxeles que ocupará en `rect` a `dpi`,
+    manteniendo la proporción. Las imágenes sin transparencia se recomprimen
+    en JPEG; si ya son suficientemente pequeñas se devuelven sin tocar.
+
+    Retorna:
+    - bytes: imagen lista para insertar en el PDF
+    """
+    pix = fitz.Pixmap(contenido)
+    ancho_max = rect.width * dpi / 72
+    alto_max = rect.height * dpi / 72
+    escala = min(ancho_max / pix.width, alto_max / pix.height)
+    if escala >= 1:
+        return contenido
+
+    if pix.colorspace and pix.colorspace.n > 3:
+        # JPEG/PNG de salida en RGB (las fotos CMYK se convierten)
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    pix = fitz.Pixmap(pix, max(1, round(pix.width * escala)), max(1, round(pix.height * escala)), None)
+    if pix.alpha:
+        return pix.tobytes("png")
+    return pix.tobytes("jpeg", jpg_quality=IMAGENES_CALIDAD_JPEG)
+
+
+def preparar_imagen(url, rect, dpi=IMAGENES_DPI):
+    """
+    Devuelve la imagen de `url` descargada (con caché) y reescalada para `rect`.
+    Las versiones reescaladas también se guardan en disco, por hash de origen,
+    tamaño de destino y calidad.
+
+    Retorna:
+    - bytes: imagen lista para `pagina.insert_image(rect, stream=...)`
+    """
+    hash_contenido, contenido = descargar_imagen(url)
+    clave = f"{hash_contenido}_{round(rect.width)}x{round(rect.height)}_{round(dpi)}_{IMAGENES_CALIDAD_JPEG}"
+    ruta_escalada = _ruta_cache("escaladas", clave)
+    try:
+        with open(ruta_escalada, "rb") as f:
+            return f.read()
+    except OSError:
+        pass
+
+    imagen = reescalar_imagen(contenido, rect, dpi)
+    _escribir_atomico(ruta_escalada, imagen)
+    return imagen
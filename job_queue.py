@@ -0,0 +1,226 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cola local de trabajos persistida en SQLite (sin broker externo)
+COLA_SQLITE_RUTA = os.getenv("COLA_SQLITE_RUTA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cola_trabajos.sqlite3"))
+COLA_WORKERS = int(os.getenv("COLA_WORKERS", "2"))
+# Si un worker muere con un trabajo reservado, otro lo retoma pasado este plazo
+COLA_PLAZO_RESERVA_SEG = float(os.getenv("COLA_PLAZO_RESERVA_SEG", "300"))
+COLA_INTERVALO_SONDEO_SEG = float(os.getenv("COLA_INTERVALO_SONDEO_SEG", "1"))
+# Trabajos siguientes cuyos negocios se leen de una vez (lectura batch) al reservar uno
+COLA_PRECARGA_MAX = int(os.getenv("COLA_PRECARGA_MAX", "50"))
+
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+
+class ColaTrabajos:
+    """
+    Cola durable de generación de PDFs. Varios procesos pueden compartir el
+    mismo archivo SQLite; las reservas usan transacciones IMMEDIATE.
+
+    Un negocio solo puede tener un trabajo pendiente por plantilla: los webhooks
+    repetidos mientras espera devuelven el mismo trabajo.
+    """
+
+    def __init__(self, ruta=COLA_SQLITE_RUTA):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._hay_trabajo = threading.Event()
+        conexion = self._conexion()
+        conexion.executescript(
+            "CREATE TABLE IF NOT EXISTS trabajos ("
+            " id TEXT PRIMARY KEY, hubspot_id TEXT NOT NULL, estado TEXT NOT NULL,"
+            " url_pdf TEXT, error TEXT, intentos INTEGER NOT NULL DEFAULT 0,"
+            " reservado_hasta REAL, creado REAL NOT NULL, actualizado REAL NOT NULL,"
+            " plantilla TEXT NOT NULL DEFAULT '');"
+            "CREATE INDEX IF NOT EXISTS trabajos_por_estado ON trabajos (estado, creado);"
+        )
+        # Colas creadas antes de poder elegir plantilla: '' es la plantilla por defecto
+        columnas = [fila["name"] for fila in conexion.execute("PRAGMA table_info(trabajos)")]
+        if "plantilla" not in columnas:
+            conexion.execute("ALTER TABLE trabajos ADD COLUMN plantilla TEXT NOT NULL DEFAULT ''")
+        conexion.executescript(
+            "DROP INDEX IF EXISTS trabajos_pendientes_por_negocio;"
+            "CREATE UNIQUE INDEX IF NOT EXISTS trabajos_pendientes_por_documento"
+            " ON trabajos (hubspot_id, plantilla) WHERE estado = 'pendiente';"
+        )
+
+    def _conexion(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=10, isolation_level=None)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def encolar(self, hubspot_id, plantilla=None):
+        """
+        Crea un trabajo para el negocio y la plantilla (None: la de por defecto)
+        o devuelve el pendiente que ya exista.
+
+        Retorna:
+        - tuple (str, bool): ID del trabajo y si es nuevo
+        """
+        conexion = self._conexion()
+        ahora = time.time()
+        plantilla = plantilla or ""
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conexion.execute(
+                "SELECT id FROM trabajos WHERE hubspot_id = ? AND plantilla = ? AND estado = ?",
+                (str(hubspot_id), plantilla, PENDIENTE),
+            ).fetchone()
+            if fila:
+                conexion.execute("COMMIT")
+                return fila["id"], False
+            id_trabajo = uuid.uuid4().hex
+            conexion.execute(
+                "INSERT INTO trabajos (id, hubspot_id, plantilla, estado, creado, actualizado) VALUES (?, ?, ?, ?, ?, ?)",
+                (id_trabajo, str(hubspot_id), plantilla, PENDIENTE, ahora, ahora),
+            )
+            conexion.execute("COMMIT")
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+        self._hay_trabajo.set()
+        return id_trabajo, True
+
+    def reservar_siguiente(self):
+        """
+        Marca como en proceso el trabajo pendiente más antiguo (o uno cuya
+        reserva expiró) y lo devuelve. Retorna None si no hay trabajo.
+        """
+        conexion = self._conexion()
+        ahora = time.time()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conexion.execute(
+                "SELECT * FROM trabajos WHERE estado = ? OR (estado = ? AND reservado_hasta < ?)"
+                " ORDER BY creado LIMIT 1",
+                (PENDIENTE, EN_PROCESO, ahora),
+            ).fetchone()
+            if fila is None:
+                conexion.execute("COMMIT")
+                return None
+            conexion.execute(
+                "UPDATE trabajos SET estado = ?, intentos = intentos + 1, reservado_hasta = ?, actualizado = ?"
+                " WHERE id = ?",
+                (EN_PROCESO, ahora + COLA_PLAZO_RESERVA_SEG, ahora, fila["id"]),
+            )
+            conexion.execute("COMMIT")
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+        return dict(fila, estado=EN_PROCESO)
+
+    def pendientes(self, limite):
+        """
+        Retorna:
+        - list[tuple]: (hubspot_id, plantilla) de los `limite` trabajos pendientes más antiguos
+        """
+        filas = self._conexion().execute(
+            "SELECT hubspot_id, plantilla FROM trabajos WHERE estado = ? ORDER BY creado LIMIT ?",
+            (PENDIENTE, limite),
+        ).fetchall()
+        return [(fila["hubspot_id"], fila["plantilla"] or None) for fila in filas]
+
+    def completar(self, id_trabajo, url_pdf):
+        self._conexion().execute(
+            "UPDATE trabajos SET estado = ?, url_pdf = ?, error = NULL, actualizado = ? WHERE id = ?",
+            (COMPLETADO, url_pdf, time.time(), id_trabajo),
+        )
+
+    def fallar(self, id_trabajo, error):
+        self._conexion().execute(
+            "UPDATE trabajos SET estado = ?, error = ?, actualizado = ? WHERE id = ?",
+            (ERROR, str(error), time.time(), id_trabajo),
+        )
+
+    def obtener(self, id_trabajo):
+        """
+        Devuelve el trabajo como dict, o None si no existe.
+        """
+        fila = self._conexion().execute("SELECT * FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+        return dict(fila) if fila else None
+
+    def esperar_trabajo(self, timeout):
+        # Despierta antes del sondeo si este proceso encoló algo
+        self._hay_trabajo.wait(timeout)
+        self._hay_trabajo.clear()
+
+
+class ProcesadorCola:
+    """
+    Pool de hilos que consume la cola y ejecuta `funcion(hubspot_id, plantilla)`
+    (plantilla None es la de por defecto), guardando como resultado la URL que devuelva.
+
+    Si se indica `precargar(trabajos)`, al reservar un trabajo se le pasan
+    también los siguientes pendientes para leer sus datos de una vez.
+    """
+
+    def __init__(self, cola, funcion, num_workers=COLA_WORKERS, precargar=None):
+        self.cola = cola
+        self.funcion = funcion
+        self.num_workers = num_workers
+        self.precargar = precargar
+        self._hilos = []
+        self._detener = threading.Event()
+        self._candado_precarga = threading.Lock()
+
+    def iniciar(self):
+        if self._hilos:
+            return
+        for numero in range(self.num_workers):
+            hilo = threading.Thread(target=self._bucle, name=f"cola-pdf-{numero}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        print(f"🧵 Cola de PDFs iniciada con {self.num_workers} workers ({self.cola.ruta})")
+
+    def detener(self):
+        self._detener.set()
+        self.cola._hay_trabajo.set()
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                trabajo = self.cola.reservar_siguiente()
+            except sqlite3.Error as e:
+                print(f"❌ Error leyendo la cola de trabajos: {e}")
+                trabajo = None
+            if trabajo is None:
+                self.cola.esperar_trabajo(COLA_INTERVALO_SONDEO_SEG)
+                continue
+            if self.precargar:
+                self._precargar_siguientes(trabajo)
+            try:
+                url_pdf = self.funcion(trabajo["hubspot_id"], trabajo["plantilla"] or None)
+                self.cola.completar(trabajo["id"], url_pdf)
+            except Exception as e:
+                print(f"❌ Error en trabajo {trabajo['id']} (negocio {trabajo['hubspot_id']}): {e}")
+                self.cola.fallar(trabajo["id"], e)
+
+    def _precargar_siguientes(self, trabajo):
+        # Un solo hilo precarga a la vez; el resto sigue sin esperar
+        if not self._candado_precarga.acquire(blocking=False):
+            return
+        try:
+            trabajos = [(trabajo["hubspot_id"], trabajo["plantilla"] or None)]
+            trabajos += self.cola.pendientes(COLA_PRECARGA_MAX)
+            if len(trabajos) > 1:
+                self.precargar(trabajos)
+        except Exception as e:
+            print(f"⚠️ No se pudieron precargar los siguientes trabajos: {e}")
+        finally:
+            self._candado_precarga.release()
@@ -0,0 +1,214 @@
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Logs estructurados (una línea JSON por evento)
+logger = logging.getLogger("pdf_service")
+
+# Negocio en curso: se añade automáticamente a los logs de cada etapa
+negocio_actual = contextvars.ContextVar("negocio_actual", default=None)
+# Etapas medidas en un proceso hijo de un pool, para devolverlas al principal (ver ejecutar_midiendo)
+_etapas_capturadas = contextvars.ContextVar("etapas_capturadas", default=None)
+
+# Buckets en segundos, pensados para llamadas HTTP y render de PDF
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Contador:
+    """
+    Contador monótono con etiquetas, al estilo de Prometheus.
+    """
+
+    tipo = "counter"
+
+    def __init__(self, nombre, descripcion):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self._valores = {}
+        self._candado = threading.Lock()
+
+    def incrementar(self, cantidad=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._candado:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def muestras(self):
+        with self._candado:
+            return [(self.nombre, dict(clave), valor) for clave, valor in self._valores.items()]
+
+
+class Histograma:
+    """
+    Histograma acumulativo con etiquetas, al estilo de Prometheus.
+    """
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, descripcion, buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # etiquetas -> [conteos por bucket, suma, total]
+        self._candado = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._candado:
+            serie = self._series.setdefault(clave, [[0] * len(self.buckets), 0.0, 0])
+            for indice, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def muestras(self):
+        resultado = []
+        with self._candado:
+            for clave, (conteos, suma, total) in self._series.items():
+                etiquetas = dict(clave)
+                for limite, conteo in zip(self.buckets, conteos):
+                    resultado.append((f"{self.nombre}_bucket", dict(etiquetas, le=str(limite)), conteo))
+                resultado.append((f"{self.nombre}_bucket", dict(etiquetas, le="+Inf"), total))
+                resultado.append((f"{self.nombre}_sum", etiquetas, suma))
+                resultado.append((f"{self.nombre}_count", etiquetas, total))
+        return resultado
+
+
+duracion_etapa = Histograma("pdf_etapa_duracion_segundos", "Duración de cada etapa de la generación del PDF")
+errores_etapa = Contador("pdf_etapa_errores_total", "Etapas terminadas con excepción")
+duracion_peticion = Histograma("pdf_peticion_duracion_segundos", "Duración total de la generación por negocio")
+peticiones = Contador("pdf_peticiones_total", "Generaciones de PDF por resultado")
+METRICAS = [duracion_etapa, errores_etapa, duracion_peticion, peticiones]
+
+
+def registrar_evento(evento, **campos):
+    """
+    Escribe un log estructurado en JSON incluyendo el negocio en curso.
+    """
+    registro = {"evento": evento, "hubspot_id": negocio_actual.get()}
+    registro.update(campos)
+    logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def contexto_negocio(hubspot_id):
+    """
+    Asocia las etapas medidas dentro del bloque al negocio `hubspot_id`
+    y mide la duración total.
+    """
+    token = negocio_actual.set(str(hubspot_id))
+    inicio = time.perf_counter()
+    resultado = "ok"
+    try:
+        yield
+    except Exception:
+        resultado = "error"
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        duracion_peticion.observar(duracion)
+        peticiones.incrementar(resultado=resultado)
+        registrar_evento("generacion_pdf", resultado=resultado, duracion_ms=round(duracion * 1000, 1))
+        negocio_actual.reset(token)
+
+
+@contextmanager
+def medir_etapa(etapa):
+    """
+    Mide la duración de una etapa, la registra en el histograma y en el log.
+    Dentro de ejecutar_midiendo solo la guarda para el proceso principal.
+    """
+    inicio = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        capturadas = _etapas_capturadas.get()
+        if capturadas is not None:
+            capturadas.append((etapa, duracion, error))
+        else:
+            registrar_etapas([(etapa, duracion, error)])
+
+
+def registrar_etapas(etapas):
+    """
+    Registra en el histograma, el contador de errores y el log una lista de
+    etapas (etapa, duracion, error | None) ya medidas.
+    """
+    for etapa, duracion, error in etapas:
+        if error is not None:
+            errores_etapa.incrementar(etapa=etapa)
+            registrar_evento("etapa_error", etapa=etapa, error=error)
+        duracion_etapa.observar(duracion, etapa=etapa)
+        registrar_evento("etapa", etapa=etapa, duracion_ms=round(duracion * 1000, 1))
+
+
+def ejecutar_midiendo(funcion, *args):
+    """
+    Ejecuta `funcion(*args)` guardando las etapas que mide en vez de
+    registrarlas. Se envía así a los pools de procesos: las métricas de un
+    proceso hijo no llegan a /metrics, que solo ve las del principal.
+
+    Retorna:
+    - tuple (resultado, etapas): se pasa a resultado_midiendo en el proceso
+      principal. Si `funcion` falla, las etapas viajan en la excepción
+      (atributo etapas_medidas)
+    """
+    etapas = []
+    token = _etapas_capturadas.set(etapas)
+    try:
+        return funcion(*args), etapas
+    except Exception as e:
+        e.etapas_medidas = etapas
+        raise
+    finally:
+        _etapas_capturadas.reset(token)
+
+
+def resultado_midiendo(futuro):
+    """
+    Espera un futuro lanzado con ejecutar_midiendo, registra en este proceso
+    las etapas medidas en el hijo y devuelve el resultado.
+    """
+    try:
+        resultado, etapas = futuro.result()
+    except Exception as e:
+        registrar_etapas(getattr(e, "etapas_medidas", ()))
+        raise
+    registrar_etapas(etapas)
+    return resultado
+
+
+def _formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    pares = ",".join(f'{clave}="{str(valor)}"' for clave, valor in sorted(etiquetas.items()))
+    return "{" + pares + "}"
+
+
+def exponer_metricas(extra=None):
+    """
+    Devuelve todas las métricas en formato de texto de Prometheus.
+
+    Parámetros:
+    - extra (dict): métricas adicionales {nombre: (tipo, descripcion, [(etiquetas, valor), ...])}
+    """
+    lineas = []
+    for metrica in METRICAS:
+        lineas.append(f"# HELP {metrica.nombre} {metrica.descripcion}")
+        lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+        for nombre, etiquetas, valor in metrica.muestras():
+            lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {valor}")
+    for nombre, (tipo, descripcion, valores) in (extra or {}).items():
+        lineas.append(f"# HELP {nombre} {descripcion}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for etiquetas, valor in valores:
+            lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {valor}")
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,55 @@
+import os
+
+import fitz  # PyMuPDF
+
+from dotenv import load_dotenv
+
+from metrics import medir_etapa
+
+load_dotenv()
+
+# Etapa final antes de subir o guardar el PDF: elimina objetos sin referencias,
+# deduplica objetos y streams idénticos (imágenes repetidas entre tramos del render
+# en paralelo), recorta las fuentes incrustadas a los glifos usados y comprime
+PDF_OPTIMIZAR = os.getenv("PDF_OPTIMIZAR", "1") == "1"
+# compression_effort de PyMuPDF: 0 usa el nivel por defecto de zlib, 100 el máximo (más CPU)
+NIVEL_COMPRESION = int(os.getenv("PDF_NIVEL_COMPRESION", "0"))
+SUBCONJUNTO_FUENTES = os.getenv("PDF_SUBCONJUNTO_FUENTES", "1") == "1"
+# 4 = recolectar, compactar y deduplicar objetos y streams
+NIVEL_LIMPIEZA = 4
+
+
+def optimizar_pdf(contenido, subconjunto_fuentes=SUBCONJUNTO_FUENTES):
+    """
+    Reescribe un PDF ya generado para reducir su tamaño.
+
+    No se aplica a los PDF que guarda render_incremental: la limpieza renumera
+    los objetos y el parcheo depende de los xrefs del render anterior.
+
+    Parámetros:
+    - contenido (bytes): PDF generado
+    - subconjunto_fuentes (bool): recortar las fuentes incrustadas; no usar en
+      el PDF editable, donde se puede escribir texto con cualquier glifo
+
+    Retorna:
+    - bytes: PDF optimizado (el mismo contenido si PDF_OPTIMIZAR=0)
+    """
+    if not PDF_OPTIMIZAR:
+        return contenido
+
+    with medir_etapa("optimizar_pdf"):
+        documento = fitz.open(stream=contenido, filetype="pdf")
+        try:
+            if subconjunto_fuentes:
+                documento.subset_fonts()
+            return documento.tobytes(
+                garbage=NIVEL_LIMPIEZA,
+                clean=True,
+                deflate=True,
+                deflate_images=True,
+                deflate_fonts=True,
+                use_objstms=True,
+                compression_effort=NIVEL_COMPRESION,
+            )
+        finally:
+            documento.close()
@@ -0,0 +1,356 @@
+import os
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from fill_pdf import generar_pdfs_en_memoria, VARIANTE_EDITABLE
+from render_incremental import (
+    renderizar_aplanado_incremental,
+    renderizar_sobre_base,
+    obtener_documento_base,
+    guardar_documento_base,
+)
+from pdf_optimizer import optimizar_pdf
+from metrics import medir_etapa, contexto_negocio, registrar_evento, ejecutar_midiendo, resultado_midiendo
+from template_registry import obtener_plan, PLANTILLA_POR_DEFECTO
+from idempotency import calcular_huella, obtener_indice_huellas, OMITIR_SIN_CAMBIOS
+from extract_data_hubspot import (
+    GestorDatosHubspot,
+    filtrar_videos_validos,
+    resolver_videos_y_factura
+    )
+
+NOTA_DOCUMENTO = "Generado nuevo documento"
+
+# Concurrencia del modo lote
+PROCESOS_RENDER = int(os.getenv("PDF_PROCESOS_RENDER", str(os.cpu_count() or 1)))
+MAX_SUBIDAS_PARALELAS = int(os.getenv("PDF_MAX_SUBIDAS_PARALELAS", "4"))
+
+
+# Resultado de generar (o reutilizar) el documento de un negocio
+ResultadoDocumento = namedtuple("ResultadoDocumento", ["file_id", "url_pdf", "sin_cambios"])
+
+_pool_render = None
+_candado_pool = threading.Lock()
+
+
+def obtener_pool_render():
+    """
+    Pool de procesos de render compartido por el proceso principal.
+
+    Dentro de un proceso hijo devuelve None y el render se hace en el propio
+    proceso. Con spawn cada hijo vuelve a importar el punto de entrada, y un
+    pool anidado lanzaría más procesos.
+    """
+    if multiprocessing.parent_process() is not None:
+        return None
+    # "spawn" evita heredar hilos y locks del proceso web al hacer fork
+    global _pool_render
+    with _candado_pool:
+        if _pool_render is None:
+            _pool_render = ProcessPoolExecutor(
+                max_workers=PROCESOS_RENDER,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool_render
+
+
+class ErrorGeneracionPdf(Exception):
+    """
+    Error controlado del flujo de generación, con el código HTTP a devolver.
+    """
+
+    def __init__(self, mensaje, codigo_http=500):
+        super().__init__(mensaje)
+        self.codigo_http = codigo_http
+
+
+def obtener_plan_plantilla(nombre_plantilla=None):
+    """
+    Plan compilado de la plantilla pedida (ver template_registry).
+    Lanza ErrorGeneracionPdf 400 si no está registrada.
+    """
+    try:
+        return obtener_plan(nombre_plantilla)
+    except ValueError as e:
+        raise ErrorGeneracionPdf(str(e), 400)
+
+
+def nombre_archivo_pdf(hubspot_id, nombre_plantilla=None):
+    if nombre_plantilla and nombre_plantilla != PLANTILLA_POR_DEFECTO:
+        return f"Empresa123-{hubspot_id}-{nombre_plantilla}.pdf"
+    return f"Empresa123-{hubspot_id}.pdf"
+
+
+def clave_documento(hubspot_id, plan):
+    # Un documento por negocio y plantilla; la plantilla por defecto usa solo el ID
+    if plan.nombre == PLANTILLA_POR_DEFECTO:
+        return str(hubspot_id)
+    return f"{hubspot_id}:{plan.nombre}"
+
+
+def construir_datos_pdf(data_hubspot, plan=None):
+    """
+    Resuelve URLs de videos y factura (solo si la plantilla las usa) y
+    construye el diccionario de campos del PDF aplicando el mapeo de la plantilla.
+    """
+    plan = plan or obtener_plan_plantilla()
+    propiedades = dict(data_hubspot)
+
+    # Obtener URLs de video y de factura (consultas en paralelo)
+    if plan.resuelve_videos or plan.resuelve_factura:
+        with medir_etapa("resolver_videos_y_factura"):
+            raw_video_urls, url_factura = resolver_videos_y_factura(
+                data_hubspot.get("url_video_trayectoria", "") if plan.resuelve_videos else "",
+                data_hubspot.get("archivo_factura_id") if plan.resuelve_factura else None
+            )
+        propiedades["url_video_trayectoria"] = filtrar_videos_validos(raw_video_urls)
+        propiedades["archivo_factura_id"] = url_factura
+
+    return plan.construir_datos(propiedades)
+
+
+def renderizar_pdf_aplanado(pdf_data, nombre_plantilla=None, clave=None, forzar=False, campos_fallidos=None):
+    """
+    Genera el PDF aplanado en este proceso y lo devuelve en bytes.
+
+    Con `clave` (ver clave_documento) se parte del último render del documento
+    y solo se redibujan los campos que cambiaron (ver render_incremental),
+    salvo con `forzar`, que hace un render completo y lo guarda como base.
+    Los campos que no se pudieron dibujar se añaden a `campos_fallidos`.
+    El resultado pasa por la etapa de optimización (ver pdf_optimizer).
+    """
+    plan = obtener_plan_plantilla(nombre_plantilla)
+    contenido = renderizar_aplanado_incremental(plan.ruta, clave, pdf_data, plan.tipos_campos, plan.ajustes_campos, forzar, campos_fallidos)
+    return optimizar_pdf(contenido)
+
+
+def renderizar_pdf_aplanado_sobre_base(pdf_data, nombre_plantilla, base):
+    """
+    Variante de renderizar_pdf_aplanado para el pool de procesos: recibe el
+    último render del documento, que guarda el proceso principal, en vez de
+    buscarlo en la caché del proceso hijo. Sin base (o forzando, ver
+    generar_pdf_aplanado) hace un render completo.
+
+    Retorna:
+    - tuple (bytes, DocumentoBase | None, list): PDF optimizado, base nueva sin
+      optimizar (None si no cambió o el render quedó incompleto) y campos que
+      no se pudieron dibujar
+    """
+    plan = obtener_plan_plantilla(nombre_plantilla)
+    campos_fallidos = []
+    contenido, base_nueva = renderizar_sobre_base(plan.ruta, base, pdf_data, plan.tipos_campos, plan.ajustes_campos, campos_fallidos)
+    return optimizar_pdf(contenido), (None if base_nueva is base else base_nueva), campos_fallidos
+
+
+def generar_pdf_aplanado(pdf_data, plan, clave, pool_render=None, forzar=False, campos_fallidos=None):
+    """
+    Genera el PDF aplanado del documento, en `pool_render` si se indica.
+    El último render de cada documento se guarda siempre en este proceso,
+    así el siguiente cambio se parchea en cualquier proceso del pool; las
+    etapas medidas en el pool también se registran aquí. Con `forzar` no se
+    parte del último render: se renderiza completo y se guarda como base.
+    Los campos que no se pudieron dibujar se añaden a `campos_fallidos`
+    (ver registrar_documento_subido).
+    """
+    if pool_render is None:
+        return renderizar_pdf_aplanado(pdf_data, plan.nombre, clave, forzar, campos_fallidos)
+    base = None if forzar else obtener_documento_base(plan.ruta, clave)
+    futuro = pool_render.submit(ejecutar_midiendo, renderizar_pdf_aplanado_sobre_base, pdf_data, plan.nombre, base)
+    pdf_aplanado, base_nueva, fallidos = resultado_midiendo(futuro)
+    guardar_documento_base(plan.ruta, clave, base_nueva)
+    if campos_fallidos is not None:
+        campos_fallidos.extend(fallidos)
+    return pdf_aplanado
+
+
+def publicar_pdf(hubspot, hubspot_id, pdf_aplanado, nombre_archivo=None):
+    """
+    Sube el PDF a HubSpot y crea la nota asociada al negocio.
+
+    Retorna:
+    - tuple (str, str): ID y URL del archivo subido
+    """
+    # Subir PDF a HubSpot
+    with medir_etapa("subir_pdf"):
+        file_id, file_url = hubspot.subir_pdf_desde_memoria(pdf_aplanado, nombre_archivo=nombre_archivo or nombre_archivo_pdf(hubspot_id))
+    if not file_id:
+        raise ErrorGeneracionPdf("No se pudo subir el PDF a HubSpot", 500)
+
+    # Crear nota asociada
+    with medir_etapa("crear_nota"):
+        note_id = hubspot.crear_nota_en_negocio(hubspot_id, NOTA_DOCUMENTO, file_id)
+    if not note_id:
+        raise ErrorGeneracionPdf("No se pudo crear la nota", 500)
+    return file_id, file_url
+
+
+def registrar_documento_subido(clave, huella, file_id, file_url, campos_fallidos=None):
+    """
+    Guarda la huella del documento subido para reutilizarlo mientras no
+    cambie. Si el render quedó incompleto (`campos_fallidos`, por ejemplo una
+    imagen que no se pudo descargar) no se guarda: el siguiente intento con
+    los mismos datos vuelve a generar el documento.
+    """
+    if campos_fallidos:
+        print(f"⚠️ PDF subido sin los campos {sorted(set(campos_fallidos))}; se regenerará en el próximo intento")
+        registrar_evento("documento_incompleto", file_id=file_id, campos_fallidos=sorted(set(campos_fallidos)))
+        return
+    obtener_indice_huellas().guardar(clave, huella, file_id, file_url)
+
+
+def buscar_documento_sin_cambios(clave, pdf_data, plan):
+    """
+    Calcula la huella del documento y busca si ya se subió uno idéntico
+    para este negocio y plantilla.
+
+    Retorna:
+    - tuple (str, ResultadoDocumento | None): huella y documento previo si no hubo cambios
+    """
+    huella = calcular_huella(pdf_data, plan.version)
+    previo = obtener_indice_huellas().buscar(clave, huella) if OMITIR_SIN_CAMBIOS else None
+    if previo:
+        registrar_evento("documento_sin_cambios", file_id=previo[0])
+        return huella, ResultadoDocumento(previo[0], previo[1], True)
+    return huella, None
+
+
+def generar_documento_negocio(hubspot_id, en_pool_procesos=False, forzar=False, nombre_plantilla=None, usar_precarga=False):
+    """
+    Flujo completo para un negocio: datos -> PDF -> subida -> nota.
+    `nombre_plantilla` elige la plantilla registrada (por defecto PLANTILLA_POR_DEFECTO)
+    y solo se leen de HubSpot las propiedades que esta usa. Con `usar_precarga`
+    se aprovecha la lectura hecha por precargar_datos_negocios.
+    Con `en_pool_procesos` el render se hace en el pool de procesos compartido,
+    útil cuando se llama desde varios hilos (lote, cola de trabajos).
+
+    Si los campos del PDF y la plantilla no cambiaron desde la última subida,
+    se devuelve el archivo ya subido sin renderizar, subir ni crear nota,
+    salvo que se indique `forzar`, que además ignora el render incremental
+    guardado y hace un render completo.
+
+    Retorna:
+    - ResultadoDocumento: ID y URL del PDF subido, y si se reutilizó el anterior
+
+    Lanza ErrorGeneracionPdf si algún paso falla.
+    """
+    plan = obtener_plan_plantilla(nombre_plantilla)
+    clave = clave_documento(hubspot_id, plan)
+    with contexto_negocio(hubspot_id):
+        # 1. Obtener datos desde HubSpot
+        hubspot = GestorDatosHubspot()
+        with medir_etapa("obtener_datos_negocio"):
+            data_hubspot = hubspot.obtener_datos_negocio(hubspot_id, plan.propiedades, usar_precarga)
+        if not data_hubspot:
+            raise ErrorGeneracionPdf("No se pudo obtener datos desde HubSpot", 404)
+
+        # 2. Resolver videos/factura y construir diccionario de campos PDF
+        pdf_data = construir_datos_pdf(data_hubspot, plan)
+
+        # 3. Reutilizar el documento anterior si nada cambió
+        huella, previo = buscar_documento_sin_cambios(clave, pdf_data, plan)
+        if previo and not forzar:
+            return previo
+
+        # 4. Generar PDFs en memoria
+        pool_render = obtener_pool_render() if en_pool_procesos else None
+        campos_fallidos = []
+        with medir_etapa("generar_pdf"):
+            pdf_aplanado = generar_pdf_aplanado(pdf_data, plan, clave, pool_render, forzar, campos_fallidos)
+
+        # 5. Subir PDF a HubSpot y crear nota asociada
+        file_id, file_url = publicar_pdf(hubspot, hubspot_id, pdf_aplanado, nombre_archivo_pdf(hubspot_id, plan.nombre))
+        registrar_documento_subido(clave, huella, file_id, file_url, campos_fallidos)
+        return ResultadoDocumento(file_id, file_url, False)
+
+
+def precargar_datos_negocios(trabajos):
+    """
+    Lee con una sola llamada batch los negocios de los próximos trabajos de
+    la cola, con las propiedades que necesitan sus plantillas.
+
+    Parámetros:
+    - trabajos (list[tuple]): pares (hubspot_id, nombre_plantilla)
+
+    Retorna:
+    - int: número de negocios leídos
+    """
+    propiedades = set()
+    for nombre_plantilla in {nombre for _, nombre in trabajos}:
+        propiedades.update(obtener_plan_plantilla(nombre_plantilla).propiedades)
+    with medir_etapa("precargar_negocios"):
+        return GestorDatosHubspot().precargar_negocios([hubspot_id for hubspot_id, _ in trabajos], sorted(propiedades))
+
+
+def generar_pdf_editable_negocio(hubspot_id, nombre_plantilla=None):
+    """
+    Genera bajo demanda solo la versión editable del PDF de un negocio,
+    sin subirla a HubSpot ni crear nota.
+
+    Retorna:
+    - bytes: PDF editable
+
+    Lanza ErrorGeneracionPdf si no se pueden obtener los datos.
+    """
+    plan = obtener_plan_plantilla(nombre_plantilla)
+    with contexto_negocio(hubspot_id):
+        hubspot = GestorDatosHubspot()
+        with medir_etapa("obtener_datos_negocio"):
+            data_hubspot = hubspot.obtener_datos_negocio(hubspot_id, plan.propiedades)
+        if not data_hubspot:
+            raise ErrorGeneracionPdf("No se pudo obtener datos desde HubSpot", 404)
+
+        pdf_data = construir_datos_pdf(data_hubspot, plan)
+        with medir_etapa("generar_pdf"):
+            pdf_editable, _ = generar_pdfs_en_memoria(plan.ruta, pdf_data, variantes=(VARIANTE_EDITABLE,))
+        return optimizar_pdf(pdf_editable, subconjunto_fuentes=False)
+
+
+def generar_documentos_lote(ids_negocios, nombre_plantilla=None):
+    """
+    Genera los PDFs de varios negocios:
+    - lee las propiedades con la API batch de HubSpot,
+    - renderiza en un pool de procesos (PyMuPDF es CPU-bound),
+    - sube y crea notas con concurrencia acotada (MAX_SUBIDAS_PARALELAS).
+
+    Todos los negocios usan la misma plantilla (`nombre_plantilla`). Un ID
+    repetido se genera y sube una sola vez.
+
+    Retorna:
+    - list[dict]: un resultado por ID, en el mismo orden recibido
+    """
+    plan = obtener_plan_plantilla(nombre_plantilla)
+    ids_unicos = list(dict.fromkeys(map(str, ids_negocios)))
+    hubspot = GestorDatosHubspot()
+    with medir_etapa("obtener_datos_negocios_lote"):
+        datos_por_negocio = hubspot.obtener_datos_negocios(ids_unicos, plan.propiedades)
+    pool_render = obtener_pool_render()
+    limite_subidas = threading.BoundedSemaphore(MAX_SUBIDAS_PARALELAS)
+
+    def procesar(hubspot_id):
+        try:
+            with contexto_negocio(hubspot_id):
+                data_hubspot = datos_por_negocio.get(str(hubspot_id))
+                if not data_hubspot:
+                    raise ErrorGeneracionPdf("No se pudo obtener datos desde HubSpot", 404)
+                clave = clave_documento(hubspot_id, plan)
+                pdf_data = construir_datos_pdf(data_hubspot, plan)
+                huella, previo = buscar_documento_sin_cambios(clave, pdf_data, plan)
+                if previo:
+                    return {"id": hubspot_id, "ok": True, "url_pdf_subido": previo.url_pdf, "sin_cambios": True}
+                campos_fallidos = []
+                with medir_etapa("generar_pdf"):
+                    pdf_aplanado = generar_pdf_aplanado(pdf_data, plan, clave, pool_render, campos_fallidos=campos_fallidos)
+                with limite_subidas:
+                    file_id, file_url = publicar_pdf(hubspot, hubspot_id, pdf_aplanado, nombre_archivo_pdf(hubspot_id, plan.nombre))
+                registrar_documento_subido(clave, huella, file_id, file_url, campos_fallidos)
+            return {"id": hubspot_id, "ok": True, "url_pdf_subido": file_url, "sin_cambios": False}
+        except Exception as e:
+            return {"id": hubspot_id, "ok": False, "error": str(e)}
+
+    # Hilos suficientes para mantener ocupados los procesos de render mientras otros suben
+    hilos = PROCESOS_RENDER + MAX_SUBIDAS_PARALELAS
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="pdf-lote") as pool:
+        resultados = dict(zip(ids_unicos, pool.map(procesar, ids_unicos)))
+    return [dict(resultados[str(hubspot_id)], id=hubspot_id) for hubspot_id in ids_negocios]
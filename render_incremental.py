@@ -0,0 +1,140 @@
+import os
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+from fill_pdf import generar_pdfs_en_memoria, parchear_pdf_aplanado, tipo_campo, VARIANTE_APLANADA, TIPO_IMAGEN
+from template_cache import obtener_plantilla
+from render_paralelo import debe_renderizar_en_paralelo, renderizar_aplanado_en_paralelo
+from ttl_cache import crear_cache
+from metrics import medir_etapa, registrar_evento
+
+load_dotenv()
+
+# Último PDF aplanado por negocio, para redibujar solo los campos que cambian
+RENDER_INCREMENTAL = os.getenv("PDF_RENDER_INCREMENTAL", "1") == "1"
+INCREMENTAL_MAX_DOCUMENTOS = int(os.getenv("PDF_INCREMENTAL_MAX_DOCUMENTOS", "64"))
+INCREMENTAL_TTL_SEG = int(os.getenv("PDF_INCREMENTAL_TTL_SEG", "86400"))
+
+# Documento ya renderizado: datos con los que se dibujó y qué se dibujó por campo
+DocumentoBase = namedtuple("DocumentoBase", ["version_plantilla", "datos", "capas", "contenido"])
+
+# Siempre en memoria: guarda bytes de PDF y namedtuples, no JSON. Solo la usa el
+# proceso principal; los procesos del pool reciben la base (ver renderizar_sobre_base)
+_documentos = crear_cache("documentos_renderizados", INCREMENTAL_TTL_SEG, INCREMENTAL_MAX_DOCUMENTOS, backend="memoria")
+
+
+def campos_cambiados(datos_anteriores, datos):
+    """
+    Campos cuyo valor es distinto (o que aparecen o desaparecen) entre dos renders.
+    """
+    return sorted(campo for campo in set(datos_anteriores) | set(datos) if datos_anteriores.get(campo) != datos.get(campo))
+
+
+def obtener_documento_base(ruta_plantilla_pdf, clave_documento):
+    """
+    Último render guardado del documento, o None si no hay (o el render
+    incremental está desactivado).
+    """
+    if not RENDER_INCREMENTAL or clave_documento is None:
+        return None
+    return _documentos.obtener((obtener_plantilla(ruta_plantilla_pdf).ruta, str(clave_documento)))
+
+
+def guardar_documento_base(ruta_plantilla_pdf, clave_documento, base):
+    if RENDER_INCREMENTAL and clave_documento is not None and base is not None:
+        _documentos.guardar((obtener_plantilla(ruta_plantilla_pdf).ruta, str(clave_documento)), base)
+
+
+def renderizar_sobre_base(ruta_plantilla_pdf, base, datos_cliente, tipos_campos=None, ajustes_campos=None, campos_fallidos=None):
+    """
+    Genera el PDF aplanado reutilizando `base` (el render anterior del mismo
+    documento, ver obtener_documento_base) cuando es posible:
+    - sin cambios: se devuelven los mismos bytes,
+    - solo cambian campos de texto o enlaces: se redibujan esos campos sobre el documento anterior,
+    - cambia una imagen, la plantilla o no hay render previo: render completo.
+
+    Las imágenes fuerzan un render completo para no dejar en el archivo la
+    imagen reemplazada. `tipos_campos` y `ajustes_campos` son el tipo de render
+    y el ajuste de texto por campo del plan de la plantilla (ver template_registry).
+
+    No lee ni escribe la caché: los procesos del pool reciben la base del
+    proceso principal y le devuelven la nueva, de modo que un negocio se
+    parchea aunque cada render caiga en un proceso distinto.
+
+    Si algún campo no se pudo dibujar se añade a `campos_fallidos` y no se
+    devuelve base: un render incompleto no debe servir de punto de partida.
+
+    Retorna:
+    - tuple (bytes, DocumentoBase | None): PDF aplanado y base para el siguiente render
+    """
+    contenido, base_nueva, fallidos = _renderizar_sobre_base(ruta_plantilla_pdf, base, datos_cliente, tipos_campos, ajustes_campos)
+    if fallidos:
+        registrar_evento("render_incompleto", campos_fallidos=fallidos)
+        if campos_fallidos is not None:
+            campos_fallidos.extend(fallidos)
+        return contenido, None
+    return contenido, base_nueva
+
+
+def _renderizar_sobre_base(ruta_plantilla_pdf, base, datos_cliente, tipos_campos, ajustes_campos):
+    plantilla = obtener_plantilla(ruta_plantilla_pdf)
+    fallidos = []
+
+    if base is not None and base.version_plantilla == plantilla.version:
+        cambiados = [campo for campo in campos_cambiados(base.datos, datos_cliente) if campo in plantilla.indice_campos]
+        cambia_imagen = any(
+            tipo_campo(campo, valores.get(campo), tipos_campos) == TIPO_IMAGEN
+            for campo in cambiados
+            for valores in (base.datos, datos_cliente)
+        )
+        if not cambiados:
+            registrar_evento("render_incremental", campos_cambiados=cambiados)
+            return base.contenido, base, fallidos
+        # Sin capas (render por páginas en paralelo) no se puede parchear
+        if not cambia_imagen and base.capas is not None:
+            registrar_evento("render_incremental", campos_cambiados=cambiados)
+            with medir_etapa("parchear_campos"):
+                contenido, capas = parchear_pdf_aplanado(ruta_plantilla_pdf, base.contenido, base.capas, datos_cliente, cambiados, tipos_campos, ajustes_campos, fallidos)
+            return contenido, DocumentoBase(plantilla.version, dict(datos_cliente), capas, contenido), fallidos
+
+    if debe_renderizar_en_paralelo(plantilla, datos_cliente):
+        # El render por páginas no registra capas: el siguiente cambio volverá a renderizar completo
+        contenido = renderizar_aplanado_en_paralelo(ruta_plantilla_pdf, datos_cliente, tipos_campos, ajustes_campos, fallidos)
+        return contenido, DocumentoBase(plantilla.version, dict(datos_cliente), None, contenido), fallidos
+
+    capas = {}
+    _, contenido = generar_pdfs_en_memoria(ruta_plantilla_pdf, datos_cliente, variantes=(VARIANTE_APLANADA,), capas=capas, tipos_campos=tipos_campos,
+                                           ajustes_campos=ajustes_campos, campos_fallidos=fallidos)
+    return contenido, DocumentoBase(plantilla.version, dict(datos_cliente), capas, contenido), fallidos
+
+
+def renderizar_aplanado_incremental(ruta_plantilla_pdf, clave_documento, datos_cliente, tipos_campos=None, ajustes_campos=None, forzar=False,
+                                    campos_fallidos=None):
+    """
+    Genera el PDF aplanado en este proceso partiendo del último render guardado
+    del documento (`clave_documento`, normalmente el ID del negocio), ver
+    renderizar_sobre_base. Sin clave o con PDF_RENDER_INCREMENTAL=0 hace un
+    render completo sin guardar nada.
+
+    Con `forzar` se ignora el render guardado (por ejemplo, si se hizo con una
+    imagen que falló o que cambió tras la misma URL): render completo que pasa
+    a ser la nueva base. Los campos que no se pudieron dibujar se añaden a
+    `campos_fallidos` y ese render no se guarda.
+
+    Retorna:
+    - bytes: PDF aplanado
+    """
+    if not RENDER_INCREMENTAL or clave_documento is None:
+        plantilla = obtener_plantilla(ruta_plantilla_pdf)
+        if debe_renderizar_en_paralelo(plantilla, datos_cliente):
+            return renderizar_aplanado_en_paralelo(ruta_plantilla_pdf, datos_cliente, tipos_campos, ajustes_campos, campos_fallidos)
+        _, pdf_aplanado = generar_pdfs_en_memoria(ruta_plantilla_pdf, datos_cliente, variantes=(VARIANTE_APLANADA,), tipos_campos=tipos_campos,
+                                                  ajustes_campos=ajustes_campos, campos_fallidos=campos_fallidos)
+        return pdf_aplanado
+
+    base = None if forzar else obtener_documento_base(ruta_plantilla_pdf, clave_documento)
+    contenido, base_nueva = renderizar_sobre_base(ruta_plantilla_pdf, base, datos_cliente, tipos_campos, ajustes_campos, campos_fallidos)
+    if base_nueva is not base:
+        guardar_documento_base(ruta_plantilla_pdf, clave_documento, base_nueva)
+    return contenido
@@ -0,0 +1,117 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+from fill_pdf import generar_paginas_aplanadas, unir_paginas_aplanadas, tipo_campo, TIPO_IMAGEN
+from template_cache import obtener_plantilla
+from metrics import medir_etapa
+
+load_dotenv()
+
+# Render de un mismo documento repartiendo sus páginas entre procesos
+RENDER_PARALELO = os.getenv("PDF_RENDER_PARALELO", "0") == "1"
+PROCESOS_PAGINAS = int(os.getenv("PDF_PROCESOS_PAGINAS", str(os.cpu_count() or 1)))
+# Con menos páginas con campos que esto, repartir cuesta más de lo que ahorra
+MIN_PAGINAS_PARALELO = int(os.getenv("PDF_MIN_PAGINAS_PARALELO", "2"))
+# Peso relativo de un campo de imagen frente a uno de texto al repartir páginas
+PESO_IMAGEN = 10
+
+_pool_paginas = None
+_candado_pool = threading.Lock()
+
+
+def obtener_pool_paginas():
+    """
+    Pool de procesos para el render por páginas. Igual que
+    pdf_service.obtener_pool_render, devuelve None dentro de un proceso hijo.
+    """
+    if multiprocessing.parent_process() is not None:
+        return None
+    # "spawn" evita heredar hilos y locks del proceso web al hacer fork
+    global _pool_paginas
+    with _candado_pool:
+        if _pool_paginas is None:
+            _pool_paginas = ProcessPoolExecutor(
+                max_workers=PROCESOS_PAGINAS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool_paginas
+
+
+def debe_renderizar_en_paralelo(plantilla, datos_cliente):
+    """
+    Indica si conviene repartir las páginas del documento entre procesos:
+    opción activada, varias páginas con campos y no estar ya dentro de un
+    proceso hijo (por ejemplo, el pool de render del modo lote).
+    """
+    return (
+        RENDER_PARALELO
+        and PROCESOS_PAGINAS > 1
+        and multiprocessing.parent_process() is None
+        and len(plantilla.campos_por_pagina(datos_cliente)) >= MIN_PAGINAS_PARALELO
+    )
+
+
+def repartir_paginas(plantilla, datos_cliente, tipos_campos=None, num_tramos=PROCESOS_PAGINAS):
+    """
+    Divide las páginas con campos en tramos consecutivos de peso parecido
+    (las imágenes pesan más que los textos).
+
+    Retorna:
+    - list[tuple]: (primera_pagina, ultima_pagina) de cada tramo, en orden
+    """
+    pesos = {
+        numero_pagina: sum(
+            PESO_IMAGEN if tipo_campo(nombre, datos_cliente[nombre], tipos_campos) == TIPO_IMAGEN else 1
+            for nombre, _ in campos
+        )
+        for numero_pagina, campos in plantilla.campos_por_pagina(datos_cliente).items()
+    }
+    objetivo = sum(pesos.values()) / max(1, min(num_tramos, len(pesos)))
+
+    tramos = []
+    inicio = acumulado = None
+    for numero_pagina, peso in pesos.items():
+        if inicio is None:
+            inicio, acumulado = numero_pagina, 0
+        acumulado += peso
+        if acumulado >= objetivo and len(tramos) < num_tramos - 1:
+            tramos.append((inicio, numero_pagina))
+            inicio = None
+    if inicio is not None:
+        tramos.append((inicio, numero_pagina))
+    return tramos
+
+
+def renderizar_aplanado_en_paralelo(ruta_plantilla_pdf, datos_cliente, tipos_campos=None, ajustes_campos=None, campos_fallidos=None):
+    """
+    Genera el PDF aplanado repartiendo las páginas con campos entre los
+    procesos del pool: cada proceso dibuja su tramo de páginas y después
+    se sustituyen esos tramos en la plantilla. Si se indica `campos_fallidos`
+    se añaden los campos que no se pudieron dibujar (ver generar_pdfs_en_memoria).
+
+    Retorna:
+    - bytes: PDF aplanado
+    """
+    plantilla = obtener_plantilla(ruta_plantilla_pdf)
+    tramos = repartir_paginas(plantilla, datos_cliente, tipos_campos)
+    pool = obtener_pool_paginas()
+
+    with medir_etapa("insertar_imagenes_y_textos"):
+        futuros = [
+            pool.submit(generar_paginas_aplanadas, plantilla.ruta, datos_cliente, desde, hasta, tipos_campos, ajustes_campos)
+            for desde, hasta in tramos
+        ]
+        resultados = [futuro.result() for futuro in futuros]
+
+    if campos_fallidos is not None:
+        for _, fallidos in resultados:
+            campos_fallidos.extend(fallidos)
+    with medir_etapa("aplanar"):
+        return unir_paginas_aplanadas(
+            plantilla.ruta,
+            [(desde, hasta, contenido) for (desde, hasta), (contenido, _) in zip(tramos, resultados)],
+        )
@@ -0,0 +1,82 @@
+import os
+import hashlib
+import threading
+from collections import namedtuple
+
+import fitz  # PyMuPDF para leer la plantilla y sus campos
+
+
+# Posición de un campo dentro de la plantilla
+CampoPlantilla = namedtuple("CampoPlantilla", ["pagina", "rect", "tipo"])
+
+
+class PlantillaPdf:
+    """
+    Plantilla PDF ya leída y analizada: contenido en bytes más un índice
+    nombre de campo -> lista de CampoPlantilla (un campo puede repetirse).
+    """
+
+    def __init__(self, ruta, mtime, contenido):
+        self.ruta = ruta
+        self.mtime = mtime
+        self.contenido = contenido
+        self.version = hashlib.sha1(contenido).hexdigest()
+        self.indice_campos = {}
+        self.paginas_con_campos = []
+
+        documento = fitz.open(stream=contenido, filetype="pdf")
+        try:
+            for pagina in documento:
+                for widget in pagina.widgets() or []:
+                    campo = CampoPlantilla(pagina.number, fitz.Rect(widget.rect), widget.field_type)
+                    self.indice_campos.setdefault(widget.field_name, []).append(campo)
+                    if pagina.number not in self.paginas_con_campos:
+                        self.paginas_con_campos.append(pagina.number)
+        finally:
+            documento.close()
+
+    def abrir(self):
+        """
+        Devuelve un documento fitz nuevo abierto en memoria sobre la plantilla.
+        """
+        return fitz.open(stream=self.contenido, filetype="pdf")
+
+    def campos_por_pagina(self, datos):
+        """
+        Agrupa por número de página los campos de la plantilla presentes en `datos`.
+
+        Retorna:
+        - dict {pagina: [(nombre_campo, rect), ...]} ordenado por página
+        """
+        agrupados = {}
+        for nombre_campo in datos:
+            for campo in self.indice_campos.get(nombre_campo, ()):
+                agrupados.setdefault(campo.pagina, []).append((nombre_campo, campo.rect))
+        return dict(sorted(agrupados.items()))
+
+
+_plantillas = {}
+_candado = threading.Lock()
+
+
+def obtener_plantilla(ruta_plantilla):
+    """
+    Devuelve la plantilla cacheada para `ruta_plantilla`, recargándola
+    solo si el archivo cambió (mtime) desde la última lectura.
+    """
+    ruta = os.path.abspath(ruta_plantilla)
+    mtime = os.stat(ruta).st_mtime_ns
+
+    plantilla = _plantillas.get(ruta)
+    if plantilla is not None and plantilla.mtime == mtime:
+        return plantilla
+
+    with _candado:
+        plantilla = _plantillas.get(ruta)
+        if plantilla is None or plantilla.mtime != mtime:
+            with open(ruta, "rb") as f:
+                contenido = f.read()
+            plantilla = PlantillaPdf(ruta, mtime, contenido)
+            _plantillas[ruta] = plantilla
+            print(f"📄 Plantilla cargada: {ruta} ({len(plantilla.indice_campos)} campos)")
+        return plantilla
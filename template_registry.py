@@ -0,0 +1,195 @@
+import os
+import hashlib
+import threading
+from operator import itemgetter
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+from template_cache import obtener_plantilla
+from fill_pdf import TIPO_TEXTO, TIPO_IMAGEN, TIPO_ENLACE_VIDEO, TIPO_ENLACE_FACTURA
+from text_layout import AjusteTexto, MODO_REDUCIR, MODO_ELIPSIS
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PLANTILLA_POR_DEFECTO = os.getenv("PDF_PLANTILLA_POR_DEFECTO", "propuesta")
+
+# Propiedades cuyo valor se resuelve contra la API de archivos antes de transformarlo:
+# los IDs de videos pasan a ser la lista de URLs válidas y el ID de factura su URL
+PROPIEDAD_VIDEOS = "url_video_trayectoria"
+PROPIEDAD_FACTURA = "archivo_factura_id"
+
+TIPOS_RENDER = (TIPO_TEXTO, TIPO_IMAGEN, TIPO_ENLACE_VIDEO, TIPO_ENLACE_FACTURA)
+
+# Campo de la plantilla: de qué propiedad sale (de HubSpot o derivada, ver
+# GestorDatosHubspot.PROPIEDADES_DERIVADAS), cómo se transforma y cómo se dibuja.
+# tipo=None deduce el tipo a partir del valor en cada render; ajuste=None usa
+# text_layout.AJUSTE_POR_DEFECTO cuando el texto no cabe en el campo.
+DefinicionCampo = namedtuple("DefinicionCampo", ["campo", "propiedad", "transformacion", "tipo", "ajuste"], defaults=[None])
+DefinicionPlantilla = namedtuple("DefinicionPlantilla", ["nombre", "ruta", "campos"])
+
+
+def antes_del_guion(valor):
+    """
+    Parte del nombre del negocio antes del primer guion ("Empresa-Propuesta" -> "Empresa").
+    """
+    return (valor or "").split("-")[0]
+
+
+def o_guiones(valor):
+    return valor or "--"
+
+
+def video(indice):
+    # La propiedad de videos ya llega resuelta y rellenada a 3 elementos
+    return itemgetter(indice)
+
+
+_definiciones = {}
+
+
+def registrar_plantilla(nombre, ruta, campos):
+    """
+    Declara una plantilla disponible por nombre.
+
+    Parámetros:
+    - nombre (str): nombre con el que se elige en las peticiones
+    - ruta (str): ruta local al PDF plantilla
+    - campos (list[DefinicionCampo]): campos que se rellenan
+    """
+    for definicion in campos:
+        if definicion.tipo is not None and definicion.tipo not in TIPOS_RENDER:
+            raise ValueError(f"Tipo de render desconocido en {nombre}.{definicion.campo}: {definicion.tipo}")
+        if definicion.ajuste is not None and definicion.ajuste.modo not in (MODO_REDUCIR, MODO_ELIPSIS):
+            raise ValueError(f"Ajuste de texto desconocido en {nombre}.{definicion.campo}: {definicion.ajuste.modo}")
+    _definiciones[nombre] = DefinicionPlantilla(nombre, ruta, tuple(campos))
+
+
+registrar_plantilla(
+    "propuesta",
+    os.getenv("PDF_RUTA_PLANTILLA", os.path.join(BASE_DIR, "plantilla_pdf", "Archivoeditable.pdf")),
+    [
+        DefinicionCampo("campo_nombre", "nombre_negocio", antes_del_guion, TIPO_TEXTO),
+        DefinicionCampo("campo_telefono", "telefono_contacto", None, TIPO_TEXTO),
+        DefinicionCampo("campo_direccion", "direccion_empresa", o_guiones, TIPO_TEXTO, AjusteTexto(8, 8, MODO_ELIPSIS)),
+        DefinicionCampo("campo_actividad_comercial", "actividad_comercial", None, TIPO_TEXTO),
+        DefinicionCampo("campo_tipo_instalacion", "tipo_instalacion", None, TIPO_TEXTO),
+        DefinicionCampo("campo_numero_presupuesto", "tipo_instalacion_negocio", None, TIPO_TEXTO),
+        DefinicionCampo("descripcion_empresa", "descripcion_empresa", None, TIPO_TEXTO),
+        DefinicionCampo("campo_url_video_1", PROPIEDAD_VIDEOS, video(0), TIPO_ENLACE_VIDEO),
+        DefinicionCampo("campo_url_video_2", PROPIEDAD_VIDEOS, video(1), TIPO_ENLACE_VIDEO),
+        DefinicionCampo("campo_url_video_3", PROPIEDAD_VIDEOS, video(2), TIPO_ENLACE_VIDEO),
+        DefinicionCampo("archivo_factura_id", PROPIEDAD_FACTURA, None, TIPO_ENLACE_FACTURA),
+    ],
+)
+
+
+def _descripcion_transformacion(transformacion):
+    if transformacion is None:
+        return ""
+    codigo = getattr(transformacion, "__code__", None)
+    if codigo is None:
+        # itemgetter y similares: su repr incluye los argumentos
+        return repr(transformacion)
+    # Nombre y código compilado: editar el cuerpo de la función también cambia la versión
+    return f"{transformacion.__module__}.{transformacion.__qualname__}:{codigo.co_code.hex()}:{codigo.co_consts!r}"
+
+
+def version_declaracion(definicion):
+    """
+    Huella de la declaración de la plantilla (campos, propiedades, tipos,
+    ajustes y transformaciones), para que cambiarla invalide las huellas de
+    los documentos ya subidos aunque el PDF sea el mismo.
+    """
+    partes = [
+        f"{d.campo}|{d.propiedad}|{d.tipo}|{tuple(d.ajuste) if d.ajuste else None}|{_descripcion_transformacion(d.transformacion)}"
+        for d in definicion.campos
+    ]
+    return hashlib.sha1("\n".join(partes).encode("utf-8")).hexdigest()
+
+
+class PlanPlantilla:
+    """
+    Plantilla registrada ya compilada contra su PDF: propiedades que necesita,
+    tipo de render y ajuste de texto por campo y campos declarados que no existen en el PDF.
+
+    `version` combina la versión del PDF (`version_pdf`) con la de la
+    declaración; es la que entra en la huella de los documentos.
+    """
+
+    def __init__(self, definicion):
+        plantilla = obtener_plantilla(definicion.ruta)
+        self.nombre = definicion.nombre
+        self.ruta = plantilla.ruta
+        self.version_pdf = plantilla.version
+        self.version = hashlib.sha1(f"{plantilla.version}:{version_declaracion(definicion)}".encode("utf-8")).hexdigest()
+        self.campos = definicion.campos
+        self.propiedades = sorted({d.propiedad for d in self.campos})
+        self.tipos_campos = {d.campo: d.tipo for d in self.campos if d.tipo is not None}
+        self.ajustes_campos = {d.campo: d.ajuste for d in self.campos if d.ajuste is not None}
+        self.resuelve_videos = PROPIEDAD_VIDEOS in self.propiedades
+        self.resuelve_factura = PROPIEDAD_FACTURA in self.propiedades
+        self.campos_sin_posicion = [d.campo for d in self.campos if d.campo not in plantilla.indice_campos]
+
+    def construir_datos(self, propiedades):
+        """
+        Aplica el mapeo declarado a las propiedades del negocio (con videos y
+        factura ya resueltos) y devuelve el diccionario de campos del PDF.
+        """
+        datos = {}
+        for definicion in self.campos:
+            valor = propiedades.get(definicion.propiedad)
+            if definicion.transformacion is not None:
+                valor = definicion.transformacion(valor)
+            datos[definicion.campo] = "" if valor is None else valor
+        return datos
+
+
+_planes = {}
+_candado = threading.Lock()
+
+
+def plantillas_registradas():
+    return sorted(_definiciones)
+
+
+def obtener_plan(nombre=None):
+    """
+    Devuelve el plan compilado de la plantilla `nombre` (o la plantilla por
+    defecto). Se recompila solo si cambió el PDF de la plantilla o se volvió
+    a registrar.
+
+    Lanza ValueError si la plantilla no está registrada.
+    """
+    nombre = nombre or PLANTILLA_POR_DEFECTO
+    definicion = _definiciones.get(nombre)
+    if definicion is None:
+        raise ValueError(f"Plantilla desconocida: {nombre}")
+
+    version = obtener_plantilla(definicion.ruta).version
+    plan = _planes.get(nombre)
+    if plan is not None and plan.version_pdf == version and plan.campos is definicion.campos:
+        return plan
+
+    with _candado:
+        plan = _planes.get(nombre)
+        if plan is None or plan.version_pdf != version or plan.campos is not definicion.campos:
+            plan = PlanPlantilla(definicion)
+            _planes[nombre] = plan
+            if plan.campos_sin_posicion:
+                print(f"⚠️ Plantilla '{nombre}': campos sin posición en el PDF: {plan.campos_sin_posicion}")
+        return plan
+
+
+def compilar_plantillas():
+    """
+    Compila al arrancar todas las plantillas registradas. Las que no se
+    pueden leer se avisan y se reintentan en la primera petición.
+    """
+    for nombre in plantillas_registradas():
+        try:
+            plan = obtener_plan(nombre)
+            print(f"🗂️ Plantilla '{nombre}' compilada: {len(plan.campos)} campos, {len(plan.propiedades)} propiedades")
+        except Exception as e:
+            print(f"⚠️ No se pudo compilar la plantilla '{nombre}': {e}")
@@ -0,0 +1,19 @@
+import pytest
+
+from bench.fake_hubspot import ServidorHubspotFalso
+from bench.synthetic import crear_plantilla
+
+
+@pytest.fixture(scope="session")
+def servidor():
+    # Sirve las imágenes de los campos de foto
+    servidor = ServidorHubspotFalso().iniciar()
+    yield servidor
+    servidor.detener()
+
+
+@pytest.fixture
+def plantilla(tmp_path):
+    ruta = str(tmp_path / "plantilla.pdf")
+    campos_foto = crear_plantilla(ruta, paginas=2, fotos_por_pagina=1)
+    return ruta, campos_foto
@@ -0,0 +1,141 @@
+import pytest
+import requests
+
+import extract_data_hubspot
+from extract_data_hubspot import GestorDatosHubspot
+from hubspot_http import CuerpoMultipart
+
+
+def _cuerpo(contenido=b"%PDF-1.7 contenido"):
+    return CuerpoMultipart([
+        ("file", "documento.pdf", memoryview(contenido), "application/pdf"),
+        ("fileName", None, "documento.pdf", None),
+    ])
+
+
+def _leer_todo(cuerpo, tamano):
+    trozos = []
+    while True:
+        trozo = cuerpo.read(tamano)
+        if not trozo:
+            return b"".join(bytes(t) for t in trozos)
+        trozos.append(trozo)
+
+
+def test_read_completo_coincide_con_la_longitud():
+    cuerpo = _cuerpo()
+    contenido = _leer_todo(cuerpo, -1)
+    assert len(contenido) == len(cuerpo)
+    assert cuerpo.tell() == len(cuerpo)
+    assert contenido.startswith(f"--{cuerpo.boundary}\r\n".encode())
+    assert contenido.endswith(f"--{cuerpo.boundary}--\r\n".encode())
+    assert b'filename="documento.pdf"\r\nContent-Type: application/pdf\r\n\r\n%PDF-1.7 contenido\r\n' in contenido
+
+
+def test_read_por_trozos_no_cruza_partes_ni_copia():
+    cuerpo = _cuerpo(b"x" * 100)
+    completo = _leer_todo(_cuerpo(b"x" * 100), -1)
+    trozos = []
+    while True:
+        trozo = cuerpo.read(7)
+        if not trozo:
+            break
+        assert isinstance(trozo, memoryview)
+        assert 0 < trozo.nbytes <= 7
+        trozos.append(bytes(trozo))
+    assert len(b"".join(trozos)) == len(completo)
+
+
+def test_seek_rebobina_y_limita_la_posicion():
+    cuerpo = _cuerpo()
+    primera = _leer_todo(cuerpo, 5)
+    assert cuerpo.read(5) == b""
+
+    assert cuerpo.seek(0) == 0
+    assert _leer_todo(cuerpo, 11) == primera
+
+    assert cuerpo.seek(-10, 2) == len(cuerpo) - 10
+    assert _leer_todo(cuerpo, -1) == primera[-10:]
+    assert cuerpo.seek(-5, 1) == len(cuerpo) - 5
+    assert cuerpo.seek(-1) == 0
+    assert cuerpo.seek(10, 2) == len(cuerpo)
+
+
+def test_iter_entrega_el_cuerpo_entero():
+    cuerpo = _cuerpo(b"y" * (CuerpoMultipart.TAMANO_TROZO + 10))
+    completo = b"".join(bytes(trozo) for trozo in cuerpo)
+    cuerpo.seek(0)
+    assert completo == _leer_todo(cuerpo, -1)
+
+
+class _Respuesta:
+    def __init__(self, codigo, headers=None):
+        self.status_code = codigo
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return {"id": "1", "url": "https://example.com/1.pdf"}
+
+
+@pytest.fixture
+def subida(monkeypatch):
+    respuestas = []
+    llamadas = []
+
+    def peticion(metodo, ruta, reintentar=True, data=None, headers=None):
+        # La subida es la única política de reintentos
+        assert reintentar is False
+        llamadas.append(bytes(b"".join(bytes(t) for t in data)))
+        respuesta = respuestas.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta if isinstance(respuesta, _Respuesta) else _Respuesta(respuesta)
+
+    monkeypatch.setattr(extract_data_hubspot, "peticion_hubspot", peticion)
+    monkeypatch.setattr(extract_data_hubspot.time, "sleep", lambda segundos: None)
+    gestor = GestorDatosHubspot.__new__(GestorDatosHubspot)
+    return gestor, respuestas, llamadas
+
+
+@pytest.mark.parametrize("fallo", [
+    503,
+    requests.exceptions.ConnectTimeout("sin conexión"),
+    requests.exceptions.ConnectionError("conexión rechazada"),
+])
+def test_subida_reintenta_errores_de_conexion_y_gateway(subida, fallo):
+    gestor, respuestas, llamadas = subida
+    respuestas.extend([fallo, 200])
+    assert gestor.subir_pdf_desde_memoria(b"%PDF") == ("1", "https://example.com/1.pdf")
+    # El reintento rebobina el mismo cuerpo y lo envía completo
+    assert len(llamadas) == 2 and llamadas[0] == llamadas[1]
+
+
+@pytest.mark.parametrize("fallo", [
+    requests.exceptions.ReadTimeout("sin respuesta"),
+    500,
+])
+def test_subida_no_reintenta_si_hubspot_pudo_crear_el_archivo(subida, fallo):
+    gestor, respuestas, llamadas = subida
+    respuestas.extend([fallo, 200])
+    assert gestor.subir_pdf_desde_memoria(b"%PDF") == (None, None)
+    assert len(llamadas) == 1
+
+
+def test_subida_respeta_retry_after(subida, monkeypatch):
+    gestor, respuestas, llamadas = subida
+    esperas = []
+    monkeypatch.setattr(extract_data_hubspot.time, "sleep", esperas.append)
+    respuestas.extend([_Respuesta(429, {"Retry-After": "7"}), 200])
+    assert gestor.subir_pdf_desde_memoria(b"%PDF") == ("1", "https://example.com/1.pdf")
+    assert esperas == [7]
+
+
+def test_subida_hace_como_mucho_intentos_subida_envios(subida):
+    gestor, respuestas, llamadas = subida
+    respuestas.extend([503] * extract_data_hubspot.INTENTOS_SUBIDA)
+    assert gestor.subir_pdf_desde_memoria(b"%PDF") == (None, None)
+    assert len(llamadas) == extract_data_hubspot.INTENTOS_SUBIDA
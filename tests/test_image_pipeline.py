@@ -0,0 +1,34 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from image_pipeline import _escribir_atomico
+
+
+def test_escrituras_concurrentes_de_la_misma_ruta(tmp_path):
+    ruta = str(tmp_path / "blob")
+    contenidos = [bytes([i]) * 100_000 for i in range(8)]
+
+    def escribir(contenido):
+        for _ in range(20):
+            _escribir_atomico(ruta, contenido)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(escribir, contenidos))
+
+    # Sin errores, el archivo final es una de las escrituras completas y no quedan temporales
+    with open(ruta, "rb") as f:
+        assert f.read() in contenidos
+    assert os.listdir(tmp_path) == ["blob"]
+
+
+def test_no_deja_el_temporal_si_falla(tmp_path, monkeypatch):
+    def fallar(origen, destino):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(os, "replace", fallar)
+    ruta = str(tmp_path / "blob")
+    with pytest.raises(OSError):
+        _escribir_atomico(ruta, b"contenido")
+    assert os.listdir(tmp_path) == []
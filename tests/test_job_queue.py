@@ -0,0 +1,45 @@
+import pytest
+
+from job_queue import ColaTrabajos, PENDIENTE, EN_PROCESO, COMPLETADO
+
+
+@pytest.fixture
+def cola(tmp_path):
+    return ColaTrabajos(str(tmp_path / "cola.sqlite3"))
+
+
+def test_encolar_repetido_devuelve_el_trabajo_pendiente(cola):
+    id_trabajo, nuevo = cola.encolar("1")
+    assert nuevo
+    assert cola.encolar("1") == (id_trabajo, False)
+    assert cola.pendientes(10) == [("1", None)]
+
+
+def test_plantillas_distintas_son_trabajos_distintos(cola):
+    id_defecto, _ = cola.encolar("1")
+    id_otra, nuevo = cola.encolar("1", "otra")
+    assert nuevo and id_otra != id_defecto
+    # None y la cadena vacía son la plantilla por defecto
+    assert cola.encolar("1", "") == (id_defecto, False)
+
+
+def test_trabajo_reservado_no_deduplica_uno_nuevo(cola):
+    id_trabajo, _ = cola.encolar("1")
+    reservado = cola.reservar_siguiente()
+    assert reservado["id"] == id_trabajo and reservado["estado"] == EN_PROCESO
+
+    # El webhook llega mientras se procesa: el negocio pudo cambiar otra vez
+    id_nuevo, nuevo = cola.encolar("1")
+    assert nuevo and id_nuevo != id_trabajo
+    assert cola.encolar("1") == (id_nuevo, False)
+
+
+def test_completar_y_obtener(cola):
+    id_trabajo, _ = cola.encolar("7")
+    assert cola.obtener(id_trabajo)["estado"] == PENDIENTE
+    cola.reservar_siguiente()
+    cola.completar(id_trabajo, "https://archivos/7.pdf")
+    trabajo = cola.obtener(id_trabajo)
+    assert trabajo["estado"] == COMPLETADO and trabajo["url_pdf"] == "https://archivos/7.pdf"
+    assert cola.reservar_siguiente() is None
+    assert cola.obtener("no-existe") is None
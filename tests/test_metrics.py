@@ -0,0 +1,55 @@
+from concurrent.futures import Future
+
+import pytest
+
+from metrics import duracion_etapa, errores_etapa, medir_etapa, ejecutar_midiendo, resultado_midiendo
+
+
+def _total(etapa):
+    return sum(valor for nombre, etiquetas, valor in duracion_etapa.muestras()
+               if nombre.endswith("_count") and etiquetas == {"etapa": etapa})
+
+
+def _errores(etapa):
+    return sum(valor for _, etiquetas, valor in errores_etapa.muestras() if etiquetas == {"etapa": etapa})
+
+
+def _etapa_medida(etapa, fallar=False):
+    with medir_etapa(etapa):
+        if fallar:
+            raise ValueError("fallo de prueba")
+    return "hecho"
+
+
+def _futuro(funcion, *args):
+    # Simula el envío al pool: el hijo ejecuta y el principal recibe el resultado o la excepción
+    futuro = Future()
+    try:
+        futuro.set_result(ejecutar_midiendo(funcion, *args))
+    except Exception as e:
+        futuro.set_exception(e)
+    return futuro
+
+
+def test_las_etapas_del_hijo_se_registran_en_el_principal():
+    futuro = _futuro(_etapa_medida, "prueba_pool")
+    # En el hijo no se registra nada
+    assert _total("prueba_pool") == 0
+
+    assert resultado_midiendo(futuro) == "hecho"
+    assert _total("prueba_pool") == 1
+
+
+def test_las_etapas_viajan_con_la_excepcion():
+    futuro = _futuro(_etapa_medida, "prueba_pool_error", True)
+    assert _errores("prueba_pool_error") == 0
+
+    with pytest.raises(ValueError):
+        resultado_midiendo(futuro)
+    assert _total("prueba_pool_error") == 1
+    assert _errores("prueba_pool_error") == 1
+
+
+def test_fuera_del_pool_se_registra_directamente():
+    _etapa_medida("prueba_directa")
+    assert _total("prueba_directa") == 1
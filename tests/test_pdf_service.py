@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pdf_service
+from pdf_service import registrar_documento_subido
+
+
+class _IndiceFalso:
+    def __init__(self):
+        self.guardados = []
+
+    def guardar(self, clave, huella, file_id, file_url):
+        self.guardados.append((clave, huella, file_id, file_url))
+
+
+def test_documento_incompleto_no_guarda_la_huella(monkeypatch):
+    indice = _IndiceFalso()
+    monkeypatch.setattr(pdf_service, "obtener_indice_huellas", lambda: indice)
+
+    registrar_documento_subido("11:propuesta", "huella", "1001", "https://x/1001.pdf", ["campo_foto_0_0"])
+    assert indice.guardados == []
+
+    registrar_documento_subido("11:propuesta", "huella", "1002", "https://x/1002.pdf", [])
+    assert indice.guardados == [("11:propuesta", "huella", "1002", "https://x/1002.pdf")]
+
+
+def test_lote_genera_una_vez_cada_id(monkeypatch):
+    publicados = []
+
+    class _GestorFalso:
+        def obtener_datos_negocios(self, ids, propiedades):
+            assert ids == ["11", "12", "13"]
+            return {hubspot_id: {"nombre_negocio": hubspot_id} for hubspot_id in ids}
+
+    def publicar(hubspot, hubspot_id, pdf_aplanado, nombre_archivo=None):
+        publicados.append(hubspot_id)
+        return f"f{hubspot_id}", f"https://x/{hubspot_id}.pdf"
+
+    monkeypatch.setattr(pdf_service, "obtener_plan_plantilla", lambda nombre: SimpleNamespace(nombre="propuesta", propiedades=[]))
+    monkeypatch.setattr(pdf_service, "GestorDatosHubspot", _GestorFalso)
+    monkeypatch.setattr(pdf_service, "obtener_pool_render", lambda: None)
+    monkeypatch.setattr(pdf_service, "construir_datos_pdf", lambda data_hubspot, plan: data_hubspot)
+    monkeypatch.setattr(pdf_service, "buscar_documento_sin_cambios", lambda clave, pdf_data, plan: ("huella", None))
+    monkeypatch.setattr(pdf_service, "generar_pdf_aplanado", lambda *args, **kwargs: b"%PDF")
+    monkeypatch.setattr(pdf_service, "publicar_pdf", publicar)
+    monkeypatch.setattr(pdf_service, "registrar_documento_subido", lambda *args: None)
+
+    resultados = pdf_service.generar_documentos_lote(["11", "12", 13, "12"])
+
+    assert sorted(publicados) == ["11", "12", "13"]
+    # Un resultado por ID recibido, en el mismo orden y con el ID tal cual llegó
+    assert [r["id"] for r in resultados] == ["11", "12", 13, "12"]
+    assert resultados[1]["url_pdf_subido"] == resultados[3]["url_pdf_subido"] == "https://x/12.pdf"
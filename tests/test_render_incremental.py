@@ -0,0 +1,165 @@
+import fitz
+import pytest
+
+from fill_pdf import generar_pdfs_en_memoria, parchear_pdf_aplanado, VARIANTE_APLANADA
+from render_incremental import campos_cambiados, renderizar_sobre_base, renderizar_aplanado_incremental, obtener_documento_base
+
+
+def _renderizar(ruta, datos):
+    capas = {}
+    _, contenido = generar_pdfs_en_memoria(ruta, datos, variantes=(VARIANTE_APLANADA,), capas=capas)
+    return contenido, capas
+
+
+def _contenido_visible(contenido):
+    documento = fitz.open(stream=contenido, filetype="pdf")
+    try:
+        return [
+            (
+                sorted(palabra[4] for palabra in pagina.get_text("words")),
+                sorted(enlace["uri"] for enlace in pagina.get_links()),
+                len(pagina.get_image_info()),
+            )
+            for pagina in documento
+        ]
+    finally:
+        documento.close()
+
+
+def _imagenes_en_archivo(contenido):
+    # Todos los objetos imagen del archivo, los use una página o no
+    documento = fitz.open(stream=contenido, filetype="pdf")
+    try:
+        return sum(
+            1 for xref in range(1, documento.xref_length())
+            if documento.xref_get_key(xref, "Subtype") == ("name", "/Image")
+        )
+    finally:
+        documento.close()
+
+
+@pytest.fixture
+def datos(servidor, plantilla):
+    _, campos_foto = plantilla
+    datos = {
+        "campo_nombre": "Empresa Uno",
+        "campo_telefono": "+34 600 000 001",
+        "campo_url_video_1": "https://videos.example.com/uno.mp4",
+    }
+    for indice, campo in enumerate(campos_foto):
+        datos[campo] = f"{servidor.url}/imagenes/200x150-{indice}.jpg"
+    return datos
+
+
+def test_campos_cambiados():
+    anteriores = {"a": "1", "b": "2", "c": "3"}
+    nuevos = {"a": "1", "b": "20", "d": "4"}
+    # Cambiados, desaparecidos y nuevos
+    assert campos_cambiados(anteriores, nuevos) == ["b", "c", "d"]
+    assert campos_cambiados(anteriores, dict(anteriores)) == []
+
+
+def test_parchear_texto_y_enlace_igual_que_render_completo(plantilla, datos):
+    ruta, _ = plantilla
+    contenido, capas = _renderizar(ruta, datos)
+    nuevos = dict(datos, campo_nombre="Empresa Dos", campo_url_video_1="https://videos.example.com/dos.mp4")
+
+    parcheado, capas_nuevas = parchear_pdf_aplanado(ruta, contenido, capas, nuevos, ["campo_nombre", "campo_url_video_1"])
+
+    esperado, _ = _renderizar(ruta, nuevos)
+    assert _contenido_visible(parcheado) == _contenido_visible(esperado)
+    assert set(capas_nuevas) == set(capas)
+
+
+def test_parchear_campo_eliminado(plantilla, datos):
+    ruta, _ = plantilla
+    contenido, capas = _renderizar(ruta, datos)
+    nuevos = {campo: valor for campo, valor in datos.items() if campo != "campo_telefono"}
+
+    parcheado, capas_nuevas = parchear_pdf_aplanado(ruta, contenido, capas, nuevos, ["campo_telefono"])
+
+    assert "campo_telefono" not in capas_nuevas
+    assert _contenido_visible(parcheado) == _contenido_visible(_renderizar(ruta, nuevos)[0])
+
+
+def test_parches_sucesivos(plantilla, datos):
+    ruta, _ = plantilla
+    contenido, capas = _renderizar(ruta, datos)
+    for numero in range(3):
+        datos = dict(datos, campo_nombre=f"Empresa {numero}")
+        contenido, capas = parchear_pdf_aplanado(ruta, contenido, capas, datos, ["campo_nombre"])
+    assert _contenido_visible(contenido) == _contenido_visible(_renderizar(ruta, datos)[0])
+
+
+def test_sobre_base_sin_cambios_devuelve_la_base(plantilla, datos):
+    ruta, _ = plantilla
+    _, base = renderizar_sobre_base(ruta, None, datos)
+    contenido, base_nueva = renderizar_sobre_base(ruta, base, dict(datos))
+    assert base_nueva is base
+    assert contenido is base.contenido
+
+
+def test_sobre_base_texto_parchea(plantilla, datos):
+    ruta, _ = plantilla
+    _, base = renderizar_sobre_base(ruta, None, datos)
+    nuevos = dict(datos, campo_nombre="Otra Empresa")
+    contenido, base_nueva = renderizar_sobre_base(ruta, base, nuevos)
+    # El parche conserva las capas de los campos que no cambiaron
+    assert base_nueva.capas["campo_telefono"] == base.capas["campo_telefono"]
+    assert base_nueva.datos == nuevos
+    assert _contenido_visible(contenido) == _contenido_visible(_renderizar(ruta, nuevos)[0])
+
+
+def test_sobre_base_imagen_renderiza_completo(servidor, plantilla, datos):
+    ruta, campos_foto = plantilla
+    _, base = renderizar_sobre_base(ruta, None, datos)
+    nuevos = dict(datos, **{campos_foto[0]: f"{servidor.url}/imagenes/200x150-otra.jpg"})
+    contenido, base_nueva = renderizar_sobre_base(ruta, base, nuevos)
+    esperado, _ = _renderizar(ruta, nuevos)
+    assert _contenido_visible(contenido) == _contenido_visible(esperado)
+    # Render completo: la imagen anterior no queda en el archivo
+    assert _imagenes_en_archivo(contenido) == _imagenes_en_archivo(esperado)
+    assert base_nueva.capas is not None
+
+
+def test_forzar_ignora_la_base_guardada(plantilla, datos):
+    ruta, _ = plantilla
+    renderizar_aplanado_incremental(ruta, "forzar", datos)
+    base = obtener_documento_base(ruta, "forzar")
+
+    # Mismos datos: sin forzar se reutiliza el render guardado
+    assert renderizar_aplanado_incremental(ruta, "forzar", dict(datos)) is base.contenido
+
+    contenido = renderizar_aplanado_incremental(ruta, "forzar", dict(datos), forzar=True)
+    base_nueva = obtener_documento_base(ruta, "forzar")
+    assert contenido is not base.contenido
+    assert base_nueva is not base and base_nueva.contenido is contenido
+
+
+def test_imagen_fallida_no_deja_base(servidor, plantilla, datos):
+    ruta, campos_foto = plantilla
+    _, base = renderizar_sobre_base(ruta, None, datos)
+    nuevos = dict(datos, **{campos_foto[0]: f"{servidor.url}/no-existe.jpg"})
+
+    campos_fallidos = []
+    contenido, base_nueva = renderizar_sobre_base(ruta, base, nuevos, campos_fallidos=campos_fallidos)
+
+    # El PDF se genera igual, pero no sirve de punto de partida del siguiente render
+    assert contenido
+    assert base_nueva is None
+    assert campos_fallidos == [campos_foto[0]]
+
+
+def test_parche_con_enlace_fallido_no_deja_base(plantilla, datos, monkeypatch):
+    ruta, _ = plantilla
+    _, base = renderizar_sobre_base(ruta, None, datos)
+
+    def fallar(*args, **kwargs):
+        raise RuntimeError("enlace inválido")
+
+    monkeypatch.setattr(fitz.Page, "insert_link", fallar)
+    campos_fallidos = []
+    nuevos = dict(datos, campo_url_video_1="https://videos.example.com/dos.mp4")
+    _, base_nueva = renderizar_sobre_base(ruta, base, nuevos, campos_fallidos=campos_fallidos)
+    assert base_nueva is None
+    assert campos_fallidos == ["campo_url_video_1"]
@@ -0,0 +1,46 @@
+import pytest
+
+from template_registry import (
+    DefinicionCampo,
+    registrar_plantilla,
+    obtener_plan,
+    o_guiones,
+    video,
+    TIPO_TEXTO,
+)
+from text_layout import AjusteTexto, MODO_ELIPSIS
+
+
+@pytest.fixture
+def registrar(plantilla):
+    ruta, _ = plantilla
+
+    def registrar(campos):
+        registrar_plantilla("prueba", ruta, campos)
+        return obtener_plan("prueba")
+
+    return registrar
+
+
+def test_misma_declaracion_misma_version(registrar):
+    campos = [DefinicionCampo("campo_nombre", "nombre_negocio", None, TIPO_TEXTO)]
+    assert registrar(campos).version == registrar(list(campos)).version
+
+
+@pytest.mark.parametrize("cambiado", [
+    DefinicionCampo("campo_nombre", "otra_propiedad", None, TIPO_TEXTO),
+    DefinicionCampo("campo_nombre", "nombre_negocio", o_guiones, TIPO_TEXTO),
+    DefinicionCampo("campo_nombre", "nombre_negocio", None, None),
+    DefinicionCampo("campo_nombre", "nombre_negocio", None, TIPO_TEXTO, AjusteTexto(8, 8, MODO_ELIPSIS)),
+])
+def test_cambiar_la_declaracion_cambia_la_version(registrar, cambiado):
+    original = registrar([DefinicionCampo("campo_nombre", "nombre_negocio", None, TIPO_TEXTO)])
+    plan = registrar([cambiado])
+    assert plan.version != original.version
+    assert plan.version_pdf == original.version_pdf
+
+
+def test_argumentos_de_la_transformacion_cuentan(registrar):
+    primero = registrar([DefinicionCampo("campo_url_video_1", "url_video_trayectoria", video(0), TIPO_TEXTO)])
+    segundo = registrar([DefinicionCampo("campo_url_video_1", "url_video_trayectoria", video(1), TIPO_TEXTO)])
+    assert primero.version != segundo.version
@@ -0,0 +1,79 @@
+import pytest
+
+from text_layout import (
+    ajustar_texto,
+    partir_lineas,
+    ancho_texto,
+    _cortar_con_elipsis,
+    AjusteTexto,
+    ALTO_LINEA,
+    ELIPSIS,
+    MODO_REDUCIR,
+    MODO_ELIPSIS,
+)
+
+
+def test_partir_lineas_sin_romper_palabras():
+    ancho = ancho_texto("uno dos")
+    assert partir_lineas("uno dos tres cuatro", ancho) == ["uno dos", "tres", "cuatro"]
+
+
+def test_palabra_mas_larga_que_la_linea_se_parte_por_caracteres():
+    url = "https://example.com/videos/presentacion-empresa.mp4"
+    ancho = ancho_texto("https://exam")
+    lineas = partir_lineas(f"ver {url}", ancho)
+    assert lineas[0] == "ver"
+    assert "".join(lineas[1:]) == url
+    assert all(ancho_texto(linea) <= ancho for linea in lineas)
+
+
+def test_rectangulo_mas_estrecho_que_un_caracter():
+    # Sin espacio ni para un glifo: un carácter por línea en vez de bucle infinito
+    assert partir_lineas("abc", ancho_texto("a") / 2) == ["a", "b", "c"]
+    resultado = ajustar_texto("abc", 1, 100, AjusteTexto(8, 8, MODO_ELIPSIS))
+    assert resultado.lineas == ("a", "b", "c")
+
+
+def test_rectangulo_mas_estrecho_que_un_caracter_y_sin_alto():
+    resultado = ajustar_texto("abc", 1, 1, AjusteTexto(8, 8, MODO_ELIPSIS))
+    assert resultado.lineas == ("a" + ELIPSIS,)
+
+
+def test_saltos_de_linea_explicitos():
+    assert partir_lineas("uno\ndos\n\ntres", 1000) == ["uno", "dos", "", "tres"]
+    assert ajustar_texto("uno\ndos", 1000, 1000).lineas == ("uno", "dos")
+
+
+def test_reduce_el_tamano_hasta_que_cabe():
+    texto = "una frase con bastantes palabras"
+    ancho = ancho_texto(texto, 7)
+    resultado = ajustar_texto(texto, ancho, 7 * ALTO_LINEA, AjusteTexto(8, 6, MODO_REDUCIR))
+    assert resultado == ((texto,), 7)
+
+
+def test_elipsis_despues_de_reducir_al_minimo():
+    texto = " ".join(["palabra"] * 40)
+    ancho, alto = 100, 2 * 6 * ALTO_LINEA
+    resultado = ajustar_texto(texto, ancho, alto, AjusteTexto(8, 6, MODO_REDUCIR))
+    assert resultado.tamano == 6
+    assert len(resultado.lineas) == 2
+    assert resultado.lineas[-1].endswith(ELIPSIS)
+    assert all(ancho_texto(linea, resultado.tamano) <= ancho for linea in resultado.lineas)
+
+
+def test_modo_elipsis_no_reduce_el_tamano():
+    texto = " ".join(["palabra"] * 40)
+    resultado = ajustar_texto(texto, 100, 8 * ALTO_LINEA, AjusteTexto(8, 6, MODO_ELIPSIS))
+    assert resultado.tamano == 8
+    assert len(resultado.lineas) == 1 and resultado.lineas[0].endswith(ELIPSIS)
+
+
+@pytest.mark.parametrize("lineas, max_lineas, ancho_max, esperado", [
+    (["uno dos", "tres"], 1, ancho_texto("uno dos..."), ["uno dos..."]),
+    (["uno dos", "tres"], 1, ancho_texto("uno d..."), ["uno d..."]),
+    # No deja un espacio antes de la elipsis
+    (["uno dos", "tres"], 1, ancho_texto("uno ..."), ["uno..."]),
+    (["a", "b", "c"], 2, 100, ["a", "b..."]),
+])
+def test_cortar_con_elipsis(lineas, max_lineas, ancho_max, esperado):
+    assert _cortar_con_elipsis(list(lineas), max_lineas, ancho_max) == esperado
@@ -0,0 +1,117 @@
+import os
+import threading
+from functools import lru_cache
+from collections import namedtuple
+
+import fitz  # PyMuPDF, solo para las métricas de la fuente
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fuente con la que se dibujan los textos del PDF aplanado
+FUENTE = "helv"
+_fuente = fitz.Font(FUENTE)
+ASCENDENTE = _fuente.ascender
+# Alto de línea relativo al tamaño de letra (el que usa insert_text por defecto)
+ALTO_LINEA = _fuente.ascender - _fuente.descender
+# Helvetica base-14 no tiene el carácter "…" en su codificación
+ELIPSIS = "..."
+
+TEXTO_CACHE_MAX = int(os.getenv("PDF_TEXTO_CACHE_MAX", "4096"))
+
+# Qué hacer cuando el texto no cabe en el rectángulo del campo
+MODO_REDUCIR = "reducir"    # bajar el tamaño hasta tamano_minimo y, si aún no cabe, cortar con elipsis
+MODO_ELIPSIS = "elipsis"    # mantener el tamaño y cortar con elipsis
+PASO_TAMANO = 0.5
+
+AjusteTexto = namedtuple("AjusteTexto", ["tamano", "tamano_minimo", "modo"])
+AJUSTE_POR_DEFECTO = AjusteTexto(8, 6, MODO_REDUCIR)
+
+# Resultado de maquetar un texto: líneas a dibujar y tamaño de letra final
+TextoAjustado = namedtuple("TextoAjustado", ["lineas", "tamano"])
+
+# Ancho de cada carácter a tamaño 1, medido una sola vez por proceso
+_anchos = {}
+_candado = threading.Lock()
+
+
+def ancho_caracter(caracter):
+    ancho = _anchos.get(caracter)
+    if ancho is None:
+        with _candado:
+            ancho = _anchos[caracter] = _fuente.glyph_advance(ord(caracter))
+    return ancho
+
+
+def ancho_texto(texto, tamano=1):
+    return sum(ancho_caracter(caracter) for caracter in texto) * tamano
+
+
+@lru_cache(maxsize=TEXTO_CACHE_MAX)
+def ajustar_texto(texto, ancho, alto, ajuste=AJUSTE_POR_DEFECTO):
+    """
+    Reparte `texto` en líneas que caben en un rectángulo de `ancho` x `alto`
+    puntos usando los anchos reales de los caracteres de Helvetica. Si no
+    cabe, aplica el ajuste del campo (reducir tamaño y/o elipsis).
+
+    El resultado se cachea: los mismos valores en el mismo campo (nombre de
+    empresa, URLs...) no se vuelven a medir.
+
+    Retorna:
+    - TextoAjustado: líneas (tuple) y tamaño de letra con el que caben
+    """
+    tamano = ajuste.tamano
+    while True:
+        lineas = partir_lineas(texto, ancho / tamano)
+        max_lineas = max(1, int(alto // (tamano * ALTO_LINEA)))
+        if len(lineas) <= max_lineas:
+            return TextoAjustado(tuple(lineas), tamano)
+        if ajuste.modo == MODO_REDUCIR and tamano - PASO_TAMANO >= ajuste.tamano_minimo:
+            tamano -= PASO_TAMANO
+            continue
+        return TextoAjustado(tuple(_cortar_con_elipsis(lineas, max_lineas, ancho / tamano)), tamano)
+
+
+def partir_lineas(texto, ancho_max):
+    """
+    Parte el texto en líneas de como mucho `ancho_max` (medido a tamaño 1)
+    sin romper palabras; las palabras más largas que una línea (URLs) se
+    parten por caracteres. Respeta los saltos de línea del texto.
+    """
+    lineas = []
+    for parrafo in str(texto).split("\n"):
+        linea = ""
+        for palabra in parrafo.split():
+            candidata = f"{linea} {palabra}" if linea else palabra
+            if ancho_texto(candidata) <= ancho_max:
+                linea = candidata
+                continue
+            if linea:
+                lineas.append(linea)
+            # Palabra que no cabe sola en una línea: se parte por caracteres
+            # (el último carácter se queda en `linea` aunque no quepa)
+            while len(palabra) > 1 and ancho_texto(palabra) > ancho_max:
+                corte = _caracteres_que_caben(palabra, ancho_max)
+                lineas.append(palabra[:corte])
+                palabra = palabra[corte:]
+            linea = palabra
+        lineas.append(linea)
+    return lineas
+
+
+def _caracteres_que_caben(texto, ancho_max):
+    ancho = 0
+    for indice, caracter in enumerate(texto):
+        ancho += ancho_caracter(caracter)
+        if ancho > ancho_max:
+            return max(1, indice)
+    return len(texto)
+
+
+def _cortar_con_elipsis(lineas, max_lineas, ancho_max):
+    visibles = lineas[:max_lineas]
+    ultima = visibles[-1]
+    corte = _caracteres_que_caben(ultima, ancho_max - ancho_texto(ELIPSIS))
+    visibles[-1] = ultima[:corte].rstrip() + ELIPSIS
+    return visibles
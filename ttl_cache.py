@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Backend por defecto: "memoria" (por proceso) o "sqlite" (compartido entre workers locales)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memoria")
+CACHE_SQLITE_RUTA = os.getenv("CACHE_SQLITE_RUTA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_hubspot.sqlite3"))
+
+
+class CacheMemoria:
+    """
+    Caché en memoria del proceso con expiración (TTL) y desalojo LRU.
+    Solo se guardan valores distintos de None.
+    """
+
+    def __init__(self, nombre, ttl_seg, max_entradas=1024):
+        self.nombre = nombre
+        self.ttl_seg = ttl_seg
+        self.max_entradas = max_entradas
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()  # clave -> (expira, valor)
+        self._candado = threading.Lock()
+
+    def obtener(self, clave):
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None:
+                    del self._entradas[clave]
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave, valor, ttl_seg=None):
+        if valor is None:
+            return
+        expira = time.monotonic() + (self.ttl_seg if ttl_seg is None else ttl_seg)
+        with self._candado:
+            self._entradas[clave] = (expira, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def eliminar(self, clave):
+        with self._candado:
+            self._entradas.pop(clave, None)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def obtener_o_calcular(self, clave, funcion):
+        """
+        Devuelve el valor cacheado o lo calcula con `funcion()` y lo guarda.
+        """
+        valor = self.obtener(clave)
+        if valor is None:
+            valor = funcion()
+            self.guardar(clave, valor)
+        return valor
+
+    def estadisticas(self):
+        return {"aciertos": self.aciertos, "fallos": self.fallos, "entradas": len(self)}
+
+
+class CacheSQLite(CacheMemoria):
+    """
+    Caché con TTL y desalojo LRU persistida en un archivo SQLite local,
+    compartida por todos los workers de la misma máquina. Los valores deben
+    ser serializables a JSON. Los contadores de aciertos/fallos son del proceso.
+    """
+
+    def __init__(self, nombre, ttl_seg, max_entradas=1024, ruta=CACHE_SQLITE_RUTA):
+        super().__init__(nombre, ttl_seg, max_entradas)
+        self.ruta = ruta
+        self._local = threading.local()
+        with self._conexion() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " espacio TEXT NOT NULL, clave TEXT NOT NULL, valor TEXT NOT NULL,"
+                " expira REAL NOT NULL, ultimo_uso REAL NOT NULL,"
+                " PRIMARY KEY (espacio, clave))"
+            )
+
+    def _conexion(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=5)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def obtener(self, clave):
+        ahora = time.time()
+        with self._conexion() as conexion:
+            fila = conexion.execute(
+                "SELECT valor, expira FROM cache WHERE espacio = ? AND clave = ?",
+                (self.nombre, str(clave)),
+            ).fetchone()
+            if fila is None or fila[1] < ahora:
+                if fila is not None:
+                    conexion.execute("DELETE FROM cache WHERE espacio = ? AND clave = ?", (self.nombre, str(clave)))
+                self.fallos += 1
+                return None
+            conexion.execute(
+                "UPDATE cache SET ultimo_uso = ? WHERE espacio = ? AND clave = ?",
+                (ahora, self.nombre, str(clave)),
+            )
+        self.aciertos += 1
+        return json.loads(fila[0])
+
+    def guardar(self, clave, valor, ttl_seg=None):
+        if valor is None:
+            return
+        ahora = time.time()
+        expira = ahora + (self.ttl_seg if ttl_seg is None else ttl_seg)
+        with self._conexion() as conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO cache (espacio, clave, valor, expira, ultimo_uso) VALUES (?, ?, ?, ?, ?)",
+                (self.nombre, str(clave), json.dumps(valor), expira, ahora),
+            )
+            # Desalojo LRU: se conservan las max_entradas usadas más recientemente
+            conexion.execute(
+                "DELETE FROM cache WHERE espacio = ? AND clave NOT IN ("
+                " SELECT clave FROM cache WHERE espacio = ? ORDER BY ultimo_uso DESC LIMIT ?)",
+                (self.nombre, self.nombre, self.max_entradas),
+            )
+
+    def eliminar(self, clave):
+        with self._conexion() as conexion:
+            conexion.execute("DELETE FROM cache WHERE espacio = ? AND clave = ?", (self.nombre, str(clave)))
+
+    def __len__(self):
+        fila = self._conexion().execute("SELECT COUNT(*) FROM cache WHERE espacio = ?", (self.nombre,)).fetchone()
+        return fila[0]
+
+
+_caches = {}
+
+
+def crear_cache(nombre, ttl_seg, max_entradas=1024, backend=None):
+    """
+    Crea (o devuelve si ya existe) una caché con nombre usando el backend
+    configurado en CACHE_BACKEND, salvo que se indique otro.
+    """
+    if nombre in _caches:
+        return _caches[nombre]
+    backend = backend or CACHE_BACKEND
+    if backend == "sqlite":
+        cache = CacheSQLite(nombre, ttl_seg, max_entradas)
+    elif backend == "memoria":
+        cache = CacheMemoria(nombre, ttl_seg, max_entradas)
+    else:
+        raise ValueError(f"Backend de caché desconocido: {backend}")
+    _caches[nombre] = cache
+    return cache
+
+
+def estadisticas_caches():
+    """
+    Devuelve aciertos, fallos y número de entradas de cada caché creada.
+    """
+    return {nombre: cache.estadisticas() for nombre, cache in _caches.items()}
@@ -0,0 +1,177 @@
+import os
+import time
+import string
+import threading
+import multiprocessing
+
+from dotenv import load_dotenv
+
+import fitz  # PyMuPDF
+
+from fill_pdf import generar_pdfs_en_memoria, tipo_campo, VARIANTES_TODAS, TIPO_TEXTO, TIPO_IMAGEN, TIPO_ENLACE_VIDEO, TIPO_ENLACE_FACTURA
+from text_layout import ancho_texto, ajustar_texto
+from template_registry import compilar_plantillas, plantillas_registradas, obtener_plan
+from hubspot_http import obtener_sesion, obtener_cliente_hubspot, obtener_api_negocios
+from idempotency import obtener_indice_huellas
+from pdf_service import obtener_pool_render, PROCESOS_RENDER
+from render_paralelo import obtener_pool_paginas, RENDER_PARALELO, PROCESOS_PAGINAS
+from metrics import medir_etapa
+
+load_dotenv()
+
+# Arrancar al inicio los procesos de render (cola, lote y páginas en paralelo)
+PRECARGA_POOLS = os.getenv("PRECARGA_POOLS", "1") == "1"
+
+# Valores de prueba por tipo de campo; las imágenes no se rellenan para no descargar nada
+VALORES_PRUEBA = {
+    TIPO_TEXTO: "Texto de prueba para el render de precarga",
+    TIPO_ENLACE_VIDEO: "https://example.com/precarga.mp4",
+    TIPO_ENLACE_FACTURA: "https://example.com/precarga.pdf",
+}
+
+_listo = threading.Event()
+_estado = {"listo": False, "segundos": None, "etapas": {}, "errores": {}}
+
+
+def render_de_prueba(nombre_plantilla=None):
+    """
+    Renderiza las dos variantes de la plantilla con datos de prueba, sin
+    imágenes, subida ni caché incremental. Es una función de módulo para
+    poder ejecutarse en los procesos de los pools.
+
+    Retorna:
+    - int: tamaño en bytes del PDF aplanado
+    """
+    plan = obtener_plan(nombre_plantilla)
+    datos = {}
+    for definicion in plan.campos:
+        tipo = tipo_campo(definicion.campo, "", plan.tipos_campos)
+        if tipo != TIPO_IMAGEN:
+            datos[definicion.campo] = VALORES_PRUEBA.get(tipo, VALORES_PRUEBA[TIPO_TEXTO])
+    _, pdf_aplanado = generar_pdfs_en_memoria(plan.ruta, datos, variantes=VARIANTES_TODAS, tipos_campos=plan.tipos_campos, ajustes_campos=plan.ajustes_campos)
+    return len(pdf_aplanado)
+
+
+def _calentar_pdf():
+    # Primer documento del proceso: carga MuPDF y la fuente base
+    documento = fitz.open()
+    try:
+        documento.new_page().insert_text((72, 72), "precarga", fontname="helv")
+        documento.tobytes()
+    finally:
+        documento.close()
+
+
+def _calentar_fuentes():
+    # Anchos de los caracteres habituales, para que el primer texto no los mida
+    ancho_texto(string.printable + "áéíóúÁÉÍÓÚñÑüÜ¿¡€ºª")
+    ajustar_texto("precarga", 100, 20)
+
+
+def _calentar_clientes():
+    obtener_sesion()
+    obtener_cliente_hubspot()
+    obtener_api_negocios("basic_api")
+    obtener_api_negocios("batch_api")
+    obtener_indice_huellas()
+
+
+def _calentar_render():
+    for nombre in plantillas_registradas():
+        render_de_prueba(nombre)
+
+
+def _calentar_pool(pool, procesos):
+    if pool is None:
+        return
+    # Una tarea por proceso: el pool arranca un proceso nuevo mientras no haya ninguno libre
+    futuros = [pool.submit(render_de_prueba) for _ in range(procesos)]
+    for futuro in futuros:
+        futuro.result()
+
+
+def _calentar_pools():
+    _calentar_pool(obtener_pool_render(), PROCESOS_RENDER)
+    if RENDER_PARALELO and PROCESOS_PAGINAS > 1:
+        _calentar_pool(obtener_pool_paginas(), PROCESOS_PAGINAS)
+
+
+ETAPAS = [
+    ("pdf", _calentar_pdf),
+    ("plantillas", compilar_plantillas),
+    ("fuentes", _calentar_fuentes),
+    ("clientes", _calentar_clientes),
+    ("render_prueba", _calentar_render),
+]
+
+
+def precargar(inicio_arranque=None):
+    """
+    Deja el proceso listo para atender con la latencia habitual: PyMuPDF,
+    plantillas, métricas de la fuente, clientes de HubSpot y un render de
+    prueba por plantilla (y, con PRECARGA_POOLS, los procesos de render).
+
+    Una etapa que falla se avisa y no impide las siguientes; la carga
+    perezosa la reintentará en la primera petición.
+
+    Parámetros:
+    - inicio_arranque (float): time.perf_counter() al empezar a importar el
+      servidor; si se indica, el informe incluye las importaciones
+
+    Retorna:
+    - dict: estado de la precarga (ver estado_precarga)
+    """
+    inicio = time.perf_counter()
+    if inicio_arranque is not None:
+        _estado["etapas"]["importaciones"] = round(inicio - inicio_arranque, 3)
+    etapas = ETAPAS + ([("pools", _calentar_pools)] if PRECARGA_POOLS else [])
+    for nombre, funcion in etapas:
+        inicio_etapa = time.perf_counter()
+        try:
+            with medir_etapa(f"precarga_{nombre}"):
+                funcion()
+        except Exception as e:
+            print(f"⚠️ Falló la precarga '{nombre}': {e}")
+            _estado["errores"][nombre] = str(e)
+        _estado["etapas"][nombre] = round(time.perf_counter() - inicio_etapa, 3)
+
+    _estado["segundos"] = round(time.perf_counter() - (inicio_arranque or inicio), 3)
+    _estado["listo"] = True
+    _listo.set()
+    detalle = ", ".join(f"{nombre}: {segundos}s" for nombre, segundos in _estado["etapas"].items())
+    print(f"🔥 Precarga completada en {_estado['segundos']}s ({detalle})")
+    return estado_precarga()
+
+
+def iniciar_precarga(al_terminar=None, inicio_arranque=None):
+    """
+    Lanza la precarga en un hilo para que el servidor responda a /ready
+    (con 503) mientras tanto. `al_terminar` se llama cuando acaba, por
+    ejemplo para arrancar los workers de la cola ya con todo cargado.
+
+    Solo la lanza el proceso principal (desde app.crear_app): en un proceso
+    hijo de los pools no hace nada y devuelve None.
+    """
+    if multiprocessing.parent_process() is not None:
+        return None
+
+    def ejecutar():
+        precargar(inicio_arranque)
+        if al_terminar is not None:
+            al_terminar()
+
+    hilo = threading.Thread(target=ejecutar, name="precarga", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def esta_listo():
+    return _listo.is_set()
+
+
+def esperar_precarga(plazo=None):
+    return _listo.wait(plazo)
+
+
+def estado_precarga():
+    return {**_estado, "etapas": dict(_estado["etapas"]), "errores": dict(_estado["errores"])}